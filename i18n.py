@@ -0,0 +1,225 @@
+"""
+Каталоги сообщений бота.
+
+Исходники — locales/<lang>.json (плоский словарь ключ -> строка). Перед запуском
+они компилируются в один бинарный файл locales/catalogs.bin:
+
+    заголовок   <4s H H>  magic, число ключей, число языков
+    ключи       по порядку: <H длина><utf-8>
+    языки       <B длина><код><H длина><подпись кнопки><I смещение таблицы>
+    таблицы     на язык: по ключу <I смещение><I длина> строки
+    строки      utf-8 подряд
+
+Файл отображается в память (mmap): в процессе живут только список ключей и
+список языков, строки языка декодируются при первом обращении к нему.
+Поэтому время старта и память не растут с числом языков.
+
+Сборка проверяет, что во всех каталогах одинаковые ключи и плейсхолдеры
+({h}, {m}, ...), и что ключи, к которым код обращается литералом, существуют:
+
+    python i18n.py            # locales/*.json -> locales/catalogs.bin
+"""
+
+import json
+import mmap
+import os
+import re
+import string
+import struct
+import sys
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+COMPILED_NAME = "catalogs.bin"
+# Эталонный каталог: его набор ключей обязателен для остальных
+REFERENCE_LANG = "ru"
+# Ключ с подписью кнопки выбора языка — кладётся в заголовок, чтобы меню языков не грузило каталоги
+BUTTON_KEY = "lang_button"
+
+MAGIC = b"L10N"
+_HEAD = struct.Struct("<4sHH")
+_ENTRY = struct.Struct("<II")
+
+# TXT[lang]["key"], t["key"], t['key'], build_step_text(lang, n, "key")
+KEY_USAGE_RE = re.compile(
+    r"""(?:\bt|\bTXT\[[^\]]+\])\[["'](\w+)["']\]|build_step_text\([^,]+,[^,]+,\s*["'](\w+)["']"""
+)
+
+class CatalogError(Exception):
+    pass
+
+# ===================== Build =====================
+def _placeholders(text: str) -> set[str]:
+    return {name for _, name, _, _ in string.Formatter().parse(text) if name}
+
+def read_sources(locales_dir: str = LOCALES_DIR) -> dict[str, dict[str, str]]:
+    sources = {}
+    for name in sorted(os.listdir(locales_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(locales_dir, name), encoding="utf-8") as f:
+            catalog = json.load(f)
+        lang = name[:-5]
+        bad = [k for k, v in catalog.items() if not isinstance(v, str)]
+        if bad:
+            raise CatalogError(f"{lang}: values must be strings: {', '.join(bad)}")
+        sources[lang] = catalog
+    if REFERENCE_LANG not in sources:
+        raise CatalogError(f"reference catalog {REFERENCE_LANG}.json is missing")
+    return sources
+
+def validate(sources: dict[str, dict[str, str]], code_paths: tuple[str, ...] = ()) -> list[str]:
+    """Возвращает отсортированный список ключей; при расхождениях — CatalogError со всеми ошибками."""
+    reference = sources[REFERENCE_LANG]
+    keys = sorted(reference)
+    errors = []
+    if BUTTON_KEY not in reference:
+        errors.append(f"{REFERENCE_LANG}: missing {BUTTON_KEY}")
+
+    for lang, catalog in sources.items():
+        missing = sorted(set(keys) - set(catalog))
+        extra = sorted(set(catalog) - set(keys))
+        if missing:
+            errors.append(f"{lang}: missing keys {', '.join(missing)}")
+        if extra:
+            errors.append(f"{lang}: unknown keys {', '.join(extra)}")
+        for key in keys:
+            if key in catalog and _placeholders(catalog[key]) != _placeholders(reference[key]):
+                errors.append(f"{lang}.{key}: placeholders differ from {REFERENCE_LANG}")
+
+    for path in code_paths:
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        used = {a or b for a, b in KEY_USAGE_RE.findall(source)}
+        unknown = sorted(used - set(keys))
+        if unknown:
+            errors.append(f"{os.path.basename(path)}: unknown keys {', '.join(unknown)}")
+
+    if errors:
+        raise CatalogError("; ".join(errors))
+    return keys
+
+def compile_catalogs(locales_dir: str = LOCALES_DIR, code_paths: tuple[str, ...] = ()) -> str:
+    sources = read_sources(locales_dir)
+    keys = validate(sources, code_paths)
+    langs = sorted(sources, key=lambda lang: (lang != REFERENCE_LANG, lang))
+
+    head = bytearray(_HEAD.pack(MAGIC, len(keys), len(langs)))
+    for key in keys:
+        raw = key.encode("utf-8")
+        head += struct.pack("<H", len(raw)) + raw
+
+    lang_records = []
+    for lang in langs:
+        code = lang.encode("ascii")
+        button = sources[lang][BUTTON_KEY].encode("utf-8")
+        lang_records.append(struct.pack("<B", len(code)) + code + struct.pack("<H", len(button)) + button)
+    tables_at = len(head) + sum(len(r) + 4 for r in lang_records)
+    table_size = _ENTRY.size * len(keys)
+    blob_at = tables_at + table_size * len(langs)
+
+    tables = bytearray()
+    blob = bytearray()
+    for i, lang in enumerate(langs):
+        head += lang_records[i] + struct.pack("<I", tables_at + table_size * i)
+        for key in keys:
+            raw = sources[lang][key].encode("utf-8")
+            tables += _ENTRY.pack(blob_at + len(blob), len(raw))
+            blob += raw
+
+    path = os.path.join(locales_dir, COMPILED_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(head + tables + blob)
+    os.replace(tmp, path)
+    return path
+
+def is_stale(locales_dir: str = LOCALES_DIR) -> bool:
+    path = os.path.join(locales_dir, COMPILED_NAME)
+    try:
+        built = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return True
+    return any(
+        os.stat(os.path.join(locales_dir, name)).st_mtime > built
+        for name in os.listdir(locales_dir)
+        if name.endswith(".json")
+    )
+
+# ===================== Runtime =====================
+class Catalog:
+    """Строки одного языка: ключ -> строка, декодируется один раз при первом обращении."""
+
+    __slots__ = ("_catalogs", "_table", "_cache")
+
+    def __init__(self, catalogs: "Catalogs", table: int):
+        self._catalogs = catalogs
+        self._table = table
+        self._cache: list[str | None] = [None] * len(catalogs.keys)
+
+    def __getitem__(self, key: str) -> str:
+        i = self._catalogs.index[key]
+        text = self._cache[i]
+        if text is None:
+            buf = self._catalogs.buf
+            offset, length = _ENTRY.unpack_from(buf, self._table + _ENTRY.size * i)
+            text = self._cache[i] = buf[offset:offset + length].decode("utf-8")
+        return text
+
+class Catalogs:
+    """
+    Все скомпилированные языки: TXT[lang] -> Catalog.
+    Каталог языка создаётся при первом обращении к нему.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_keys, n_langs = _HEAD.unpack_from(self.buf)
+        if magic != MAGIC:
+            raise CatalogError(f"{path}: not a compiled catalog")
+        pos = _HEAD.size
+        keys = []
+        for _ in range(n_keys):
+            (n,) = struct.unpack_from("<H", self.buf, pos)
+            keys.append(self.buf[pos + 2:pos + 2 + n].decode("utf-8"))
+            pos += 2 + n
+        self.keys = tuple(keys)
+        self.index = {key: i for i, key in enumerate(keys)}
+
+        self._tables: dict[str, int] = {}
+        self.buttons: dict[str, str] = {}
+        for _ in range(n_langs):
+            n = self.buf[pos]
+            lang = self.buf[pos + 1:pos + 1 + n].decode("ascii")
+            pos += 1 + n
+            (n,) = struct.unpack_from("<H", self.buf, pos)
+            self.buttons[lang] = self.buf[pos + 2:pos + 2 + n].decode("utf-8")
+            pos += 2 + n
+            (self._tables[lang],) = struct.unpack_from("<I", self.buf, pos)
+            pos += 4
+        self.langs = tuple(self._tables)
+        self._loaded: dict[str, Catalog] = {}
+
+    def __contains__(self, lang) -> bool:
+        return lang in self._tables
+
+    def __getitem__(self, lang: str) -> Catalog:
+        catalog = self._loaded.get(lang)
+        if catalog is None:
+            catalog = self._loaded[lang] = Catalog(self, self._tables[lang])
+        return catalog
+
+def load_catalogs(locales_dir: str = LOCALES_DIR, code_paths: tuple[str, ...] = ()) -> Catalogs:
+    """Открывает locales/catalogs.bin; если его нет или исходники новее — сначала компилирует."""
+    if is_stale(locales_dir):
+        compile_catalogs(locales_dir, code_paths)
+    return Catalogs(os.path.join(locales_dir, COMPILED_NAME))
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = tuple(sys.argv[1:]) or (os.path.join(here, "main.py"),)
+    try:
+        out = compile_catalogs(code_paths=paths)
+    except CatalogError as e:
+        sys.exit(f"i18n: {e}")
+    print(f"i18n: {out}")
@@ -1,39 +1,445 @@
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import heapq
+import logging
 import os
 import re
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import unicodedata
+import zlib
+from array import array
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime, timedelta, timezone
-
-from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery
+from functools import lru_cache, partial
+
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, Update
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramConflictError,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from fastapi import FastAPI, Request
-from fastapi.responses import Response
+from i18n import load_catalogs
 
 # ===================== ENV =====================
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID", "0"))
 PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")
+# Свой Bot API сервер (telegram-bot-api или фейковый для тестов); пусто = api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
 WEBHOOK_PATH = "/tg/webhook"
+# Telegram присылает его в X-Telegram-Bot-Api-Secret-Token; пусто = выводится из BOT_TOKEN
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Апдейт Telegram — несколько КБ; всё, что больше, режем до чтения тела
+WEBHOOK_MAX_BODY = 256 * 1024
+# Куда бот пишет свои файлы (заявки, индекс дублей и т.п.)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Секрет для GET /export (заголовок X-Export-Secret); пусто = эндпоинт выключен
+EXPORT_SECRET = os.getenv("EXPORT_SECRET", "")
+ADMIN_TZ = timezone(timedelta(hours=3))
 COOLDOWN_HOURS = 12
+# Кому подача заявок закрыта: BANNED_USER_IDS=123,456
+BANNED_USER_IDS = frozenset(int(x) for x in os.getenv("BANNED_USER_IDS", "").replace(" ", "").split(",") if x)
+
+# Telegram держит не больше max_connections параллельных HTTPS-соединений к вебхуку (1..100)
+WEBHOOK_MAX_CONNECTIONS = min(max(int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")), 1), 100)
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "").strip().lower() in {"1", "true", "yes"}
+# Всё остальное (edited_message, my_chat_member, ...) бот не обрабатывает
+ALLOWED_UPDATES = ["message", "callback_query"]
+# После ~15 секунд Telegram отвечает на answerCallbackQuery "query is too old"
+CALLBACK_MAX_AGE = 15.0
+# Polling: сколько апдейтов обрабатываем одновременно (разные пользователи — параллельно)
+POLL_MAX_TASKS = max(int(os.getenv("POLL_MAX_TASKS", "100")), 1)
+# Брошенные анкеты: через сколько простоя сессия удаляется и сколько сессий держим максимум
+SESSION_TTL_MINUTES = max(int(os.getenv("SESSION_TTL_MINUTES", str(24 * 60))), 1)
+MAX_SESSIONS = max(int(os.getenv("MAX_SESSIONS", "100000")), 1)
+# Сколько секунд при остановке ждём начатые апдейты, прежде чем сохранить состояние и выйти
+DRAIN_TIMEOUT = max(float(os.getenv("DRAIN_TIMEOUT", "20")), 0.0)
+# Рассылка по заявителям: сообщений в секунду (общий лимит Telegram ~30/с, оставляем запас анкетам)
+BROADCAST_RATE = max(float(os.getenv("BROADCAST_RATE", "20")), 0.1)
+# Куда слать заявки помимо ADMIN_CHAT_ID — правила, см. AdminRoutes; пусто = всё в ADMIN_CHAT_ID
+ADMIN_ROUTES = os.getenv("ADMIN_ROUTES", "")
+# Лимит Telegram на группу — ~20 сообщений в минуту; у каждого чата заявок своя очередь с этим темпом
+ADMIN_RATE_PER_MIN = max(float(os.getenv("ADMIN_RATE_PER_MIN", "20")), 1.0)
+ADMIN_QUEUE_MAX = max(int(os.getenv("ADMIN_QUEUE_MAX", "1000")), 1)
+# Напоминание тем, кто застрял на шаге анкеты: через сколько минут простоя; 0 = не напоминать
+REMINDER_AFTER_MINUTES = max(float(os.getenv("REMINDER_AFTER_MINUTES", "60")), 0.0)
+# Сообщений в секунду на напоминания — малая доля общего лимита, анкетам не мешают
+REMINDER_RATE = max(float(os.getenv("REMINDER_RATE", "3")), 0.1)
+# Если event loop занят дольше стольких мс — пишем в лог стек того, кто его держит
+SLOW_CALLBACK_MS = max(int(os.getenv("SLOW_CALLBACK_MS", "200")), 1)
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN is not set")
 if ADMIN_CHAT_ID == 0:
     raise RuntimeError("ADMIN_CHAT_ID is not set or invalid")
 
+if not WEBHOOK_SECRET:
+    WEBHOOK_SECRET = hmac.new(BOT_TOKEN.encode(), b"webhook-secret", hashlib.sha256).hexdigest()
+if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", WEBHOOK_SECRET):
+    raise RuntimeError("WEBHOOK_SECRET must be 1-256 chars of A-Z, a-z, 0-9, _ and -")
+
 WEBHOOK_URL = f"{PUBLIC_URL}{WEBHOOK_PATH}" if PUBLIC_URL else ""
 
-bot = Bot(BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-app = FastAPI()
+# Admission control: с какого числа апдейтов в работе отвечаем "занято" и сколько хэндлеров
+# работает одновременно. Больше, чем max_connections вебхука (или POLL_MAX_TASKS), апдейтов
+# в работе не бывает — по умолчанию отказываем с 80% этого потолка, а слотов хэндлеров вдвое
+# меньше порога, чтобы перед ними копилась очередь и колбэки обгоняли текстовые шаги
+UPDATE_CONCURRENCY = WEBHOOK_MAX_CONNECTIONS if WEBHOOK_URL else POLL_MAX_TASKS
+SHED_THRESHOLD = max(int(os.getenv("SHED_THRESHOLD") or UPDATE_CONCURRENCY * 4 // 5), 1)
+HANDLER_SLOTS = max(int(os.getenv("HANDLER_SLOTS") or SHED_THRESHOLD // 2), 1)
+# Лимит Telegram на сообщения общий для всего бота: пока апдейтов в работе столько или больше,
+# фоновые отправки (напоминания, рассылка) ждут — живые анкеты важнее
+BACKGROUND_BUSY_INFLIGHT = max(HANDLER_SLOTS // 2, 1)
+
+log = logging.getLogger("recruit")
+
+# ===================== Per-user ordering =====================
+LOCK_STRIPES = 256
+
+class StripedEventIsolation(BaseEventIsolation):
+    """
+    Апдейты одного пользователя обрабатываются строго по очереди (asyncio.Lock — FIFO),
+    разных — параллельно. Пул локов фиксированный: пользователь попадает в полосу
+    по хэшу ключа, поэтому память не растёт с числом пользователей
+    (SimpleEventIsolation держит по локу на каждого, кого когда-либо видел).
+    """
+
+    def __init__(self, stripes: int = LOCK_STRIPES):
+        self._locks = tuple(asyncio.Lock() for _ in range(stripes))
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey):
+        async with self._locks[hash((key.chat_id, key.user_id)) % len(self._locks)]:
+            yield
+
+    async def close(self) -> None:
+        pass
+
+# ===================== FSM storage =====================
+# Выборы анкеты храним кодом: индекс значения из callback_data
+NOBLE_CHOICES = ("yes", "no", "progress")
+MIC_CHOICES = ("yes", "no")
+READY_CHOICES = ("yes", "sometimes", "no")
+PHOTO_KINDS = ("photo", "document")
+
+def choice_code(choices: tuple[str, ...], value: str) -> int:
+    """callback-значение -> код; неизвестное — последний вариант (как раньше делал else)."""
+    return choices.index(value) if value in choices else len(choices) - 1
+
+class Application:
+    """
+    Анкета в работе: фиксированная схема вместо dict на пользователя.
+    Выборы (noble/mic/ready) — коды из *_CHOICES, discipline — bool, не заполнено — None.
+    Скриншот — только file_id/file_unique_id Telegram и photo_kind (PHOTO_KINDS), сам файл не качаем.
+    Хранилище держит объект как есть, хэндлеры и рендеры читают/пишут поля напрямую.
+    """
+    TEXT_FIELDS = (
+        "lang", "nick", "real_name", "contact", "country", "prof", "prime", "why",
+        "photo_id", "photo_uid",
+    )
+    # -1 = не заполнено
+    CODE_FIELDS = ("lvl", "noble", "mic", "ready", "discipline", "photo_kind")
+    __slots__ = TEXT_FIELDS + CODE_FIELDS
+    _HEAD = struct.Struct("<6b")
+
+    def __init__(self, lang: str | None = None):
+        self.lang = lang
+        for name in self.__slots__[1:]:
+            setattr(self, name, None)
+
+    def as_dict(self) -> dict:
+        return {name: v for name in self.__slots__ if (v := getattr(self, name)) is not None}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Application":
+        form = cls()
+        for name in cls.__slots__:
+            setattr(form, name, data.get(name))
+        return form
+
+    def pack(self) -> bytes:
+        """Компактная форма: 6 байт кодов, затем строки как <длина:2 байта><utf-8>."""
+        out = bytearray(self._HEAD.pack(*(
+            -1 if (v := getattr(self, name)) is None else int(v) for name in self.CODE_FIELDS
+        )))
+        for name in self.TEXT_FIELDS:
+            raw = (getattr(self, name) or "").encode("utf-8")
+            out += len(raw).to_bytes(2, "little") + raw
+        return bytes(out)
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "Application":
+        form = cls()
+        for name, v in zip(cls.CODE_FIELDS, cls._HEAD.unpack_from(raw)):
+            if v >= 0:
+                setattr(form, name, bool(v) if name == "discipline" else v)
+        pos = cls._HEAD.size
+        for name in cls.TEXT_FIELDS:
+            n = int.from_bytes(raw[pos:pos + 2], "little")
+            if n:
+                setattr(form, name, raw[pos + 2:pos + 2 + n].decode("utf-8"))
+            pos += 2 + n
+        return form
+
+class SessionRecord:
+    __slots__ = ("state", "form", "expires", "size")
+
+    def __init__(self):
+        self.state: str | None = None
+        self.form: Application | None = None
+        self.expires = 0.0
+        self.size = 0
+
+def estimate_bytes(record: SessionRecord) -> int:
+    size = sys.getsizeof(record)
+    form = record.form
+    if form is not None:
+        size += sys.getsizeof(form)
+        for name in Application.TEXT_FIELDS:
+            v = getattr(form, name)
+            if v is not None:
+                size += sys.getsizeof(v)
+    return size
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    In-memory FSM с TTL и потолком числа сессий.
+    Сессия живёт ttl секунд с последнего обращения. Сроки разложены по корзинам
+    шириной bucket секунд, поэтому чистильщик за тик смотрит только истёкшие корзины,
+    а не все сессии. При превышении max_sessions вытесняется самая давняя (LRU).
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, bucket: float = 60.0):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.bucket = bucket
+        self._sessions: OrderedDict[StorageKey, SessionRecord] = OrderedDict()
+        self._expiry: dict[int, set[StorageKey]] = {}
+        self._swept = int(time.monotonic() // bucket)
+        self._sweeper: asyncio.Task | None = None
+        self.bytes = 0
+        # Зовётся с (ключ, новое состояние) на каждый set_state; при удалении сессии — с None
+        self.on_state = None
+
+    @property
+    def live(self) -> int:
+        return len(self._sessions)
+
+    def _touch(self, key: StorageKey, create: bool) -> SessionRecord | None:
+        record = self._sessions.get(key)
+        if record is None:
+            if not create:
+                return None
+            record = self._sessions[key] = SessionRecord()
+            record.size = estimate_bytes(record)
+            self.bytes += record.size
+            if len(self._sessions) > self.max_sessions:
+                old_key, _ = next(iter(self._sessions.items()))
+                self._drop(old_key)
+                STATS["sessions_evicted"] += 1
+        else:
+            self._sessions.move_to_end(key)
+        self._set_expiry(key, record, time.monotonic() + self.ttl)
+        return record
+
+    def _set_expiry(self, key: StorageKey, record: SessionRecord, expires: float):
+        old_slot = int(record.expires // self.bucket)
+        record.expires = expires
+        new_slot = int(record.expires // self.bucket)
+        if new_slot != old_slot:
+            keys = self._expiry.get(old_slot)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._expiry[old_slot]
+            self._expiry.setdefault(new_slot, set()).add(key)
+
+    def _drop(self, key: StorageKey):
+        record = self._sessions.pop(key, None)
+        if record is None:
+            return
+        self.bytes -= record.size
+        keys = self._expiry.get(int(record.expires // self.bucket))
+        if keys is not None:
+            keys.discard(key)
+        if self.on_state is not None:
+            self.on_state(key, None)
+
+    def _maybe_drop_empty(self, key: StorageKey, record: SessionRecord):
+        if record.state is None and record.form is None:
+            self._drop(key)
+
+    def sweep(self, now: float | None = None) -> int:
+        """Удаляет истёкшие сессии из корзин, чей срок уже прошёл. Возвращает сколько удалено."""
+        now = time.monotonic() if now is None else now
+        current = int(now // self.bucket)
+        removed = 0
+        for slot in range(self._swept, current):
+            for key in self._expiry.pop(slot, ()):
+                record = self._sessions.get(key)
+                if record is not None and record.expires <= now:
+                    self._drop(key)
+                    removed += 1
+        self._swept = max(self._swept, current)
+        STATS["sessions_expired"] += removed
+        return removed
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.bucket)
+            self.sweep()
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._sweeper
+            self._sweeper = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._touch(key, create=state is not None)
+        if record is None:
+            return
+        record.state = state.state if isinstance(state, State) else state
+        # Хэндлеры меняют анкету на месте, set_state идёт после каждого шага — тут и пересчитываем
+        self._resize(record)
+        if self.on_state is not None:
+            self.on_state(key, record.state)
+        self._maybe_drop_empty(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = self._touch(key, create=False)
+        return record.state if record else None
+
+    def _resize(self, record: SessionRecord):
+        self.bytes -= record.size
+        record.size = estimate_bytes(record)
+        self.bytes += record.size
+
+    def get_form(self, key: StorageKey) -> Application:
+        """Анкета пользователя без копирования; создаётся при первом обращении."""
+        record = self._touch(key, create=True)
+        if record.form is None:
+            record.form = Application()
+            self._resize(record)
+        return record.form
+
+    def set_form(self, key: StorageKey, form: Application | None):
+        record = self._touch(key, create=form is not None)
+        if record is None:
+            return
+        record.form = form
+        self._resize(record)
+        self._maybe_drop_empty(key, record)
+
+    # Совместимость с BaseStorage: dict-представление анкеты (копия, как в MemoryStorage)
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        self.set_form(key, Application.from_dict(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        record = self._touch(key, create=False)
+        return record.form.as_dict() if record and record.form else {}
+
+    def peek(self, key: StorageKey) -> SessionRecord | None:
+        """Сессия без продления TTL и без подъёма в LRU — для фоновых задач."""
+        return self._sessions.get(key)
+
+    def records(self):
+        """(ключ, состояние, анкета, сколько секунд осталось жить) — от давних к свежим."""
+        now = time.monotonic()
+        for key, record in self._sessions.items():
+            yield key, record.state, record.form, record.expires - now
+
+    def restore(self, key: StorageKey, state: str | None, form: Application | None, ttl_left: float):
+        record = self._touch(key, create=True)
+        record.state = state
+        record.form = form
+        self._set_expiry(key, record, time.monotonic() + min(ttl_left, self.ttl))
+        self._resize(record)
+        if self.on_state is not None:
+            self.on_state(key, state)
+
+storage = BoundedMemoryStorage(ttl=SESSION_TTL_MINUTES * 60, max_sessions=MAX_SESSIONS)
+
+if TELEGRAM_API_URL:
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(BOT_TOKEN)
+# disable_fsm: FSM-middleware регистрируем сами ниже, после дешёвых проверок (см. Admission)
+dp = Dispatcher(storage=storage, events_isolation=StripedEventIsolation(), disable_fsm=True)
 
 # ===================== Anti-spam =====================
-last_submit: dict[int, datetime] = {}
+class CooldownLedger:
+    """
+    user_id -> время последней заявки, только за последние COOLDOWN_HOURS.
+    Записи идут в порядке времени (повторная заявка переносится в конец),
+    поэтому устаревшие срезаются с головы: поиск O(1), память — только на окно.
+    """
+
+    def __init__(self, window: timedelta):
+        self.window = window
+        self._last: OrderedDict[int, datetime] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def _prune(self, now: datetime):
+        while self._last:
+            user_id, ts = next(iter(self._last.items()))
+            if now - ts < self.window:
+                break
+            del self._last[user_id]
+
+    def remaining(self, user_id: int, now: datetime) -> timedelta | None:
+        self._prune(now)
+        ts = self._last.get(user_id)
+        return None if ts is None else self.window - (now - ts)
+
+    def record(self, user_id: int, now: datetime):
+        self._last[user_id] = now
+        self._last.move_to_end(user_id)
+        self._prune(now)
+
+    def forget(self, user_id: int):
+        self._last.pop(user_id, None)
+
+    def items(self):
+        """(user_id, время заявки) от старых к новым."""
+        return self._last.items()
+
+last_submit = CooldownLedger(timedelta(hours=COOLDOWN_HOURS))
 LINK_RE = re.compile(r"(https?://|t\.me/|www\.)", re.IGNORECASE)
 AT_RE = re.compile(r"@", re.IGNORECASE)
 
@@ -64,335 +470,86 @@ async def safe_cq_answer(cq: CallbackQuery, text: str | None = None, **kwargs):
     except TelegramBadRequest:
         pass
 
+async def gather_api_calls(*calls) -> list:
+    """
+    Независимые вызовы Bot API (правка сообщения пользователю, заявка админам) — параллельно.
+    Ошибка одного не отменяет и не прячет остальные: каждая логируется отдельно,
+    результат (или исключение) возвращается на своей позиции.
+    """
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for r in results:
+        if isinstance(r, Exception):
+            log.error("Bot API call failed: %r", r, exc_info=r)
+    return results
+
+# ===================== Render cache =====================
+# Счётчики для /stats
+STATS: Counter[str] = Counter()
+
+RENDER_CACHE_SIZE = 10_000
+# chat_id -> (message_id, хэш текста и клавиатуры), что сейчас показано в сообщении бота
+_rendered: OrderedDict[int, tuple[int, int]] = OrderedDict()
+
+def render_hash(text: str, reply_markup: InlineKeyboardMarkup | None) -> int:
+    buttons = ()
+    if reply_markup is not None:
+        buttons = tuple(
+            (b.text, b.callback_data, b.url)
+            for row in reply_markup.inline_keyboard
+            for b in row
+        )
+    return hash((text, buttons))
+
+async def edit_text_cached(message: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> bool:
+    """
+    edit_text, который не ходит в API, если в сообщении уже тот же текст и клавиатура.
+    "message is not modified" от Telegram тоже считаем успехом.
+    Возвращает True, если запрос к API был.
+    """
+    chat_id = message.chat.id
+    rendered = (message.message_id, render_hash(text, reply_markup))
+
+    if _rendered.get(chat_id) == rendered:
+        _rendered.move_to_end(chat_id)
+        STATS["edits_skipped"] += 1
+        return False
+
+    try:
+        await message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+        STATS["edits_not_modified"] += 1
+
+    _rendered[chat_id] = rendered
+    _rendered.move_to_end(chat_id)
+    if len(_rendered) > RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+    return True
+
 # ===================== i18n =====================
-SUPPORTED_LANGS = ("ru", "ua", "en")
-
-TXT = {
-    "ru": {
-        "choose_lang": "🌍 Выбери язык:",
-        "welcome": (
-            "👑 <b>SOBRANIEGOLD — официальный набор</b>\n\n"
-            "Анкеты рассматриваются нашей командой.\n"
-            "Заполнение анкеты — обязательное условие.\n\n"
-            "Нажми <b>«Подать заявку»</b> и заполни анкету.\n"
-            "⚠️ В анкете <b>без ссылок</b> и <b>@</b> (кроме поля «Контакт TG»)."
-        ),
-        "btn_apply": "📝 Подать заявку",
-        "btn_info": "ℹ️ Инфо/Требования",
-        "info": (
-            "ℹ️ <b>Инфо</b>\n\n"
-            "Заполни анкету — офицеры рассмотрят её.\n"
-            "При положительном решении с тобой свяжутся в Telegram.\n\n"
-            "Нажми <b>«Подать заявку»</b>, чтобы начать."
-        ),
-        "cancel": "❌ Отмена",
-        "back": "⬅️ Назад",
-        "cancelled": "Ок, отменил. Если захочешь — подай заявку заново.",
-        "restart": "🔄 Заполнить заново",
-        "send": "✅ Отправить",
-
-        "form": "📝 <b>Анкета</b>",
-
-        # 1/12
-        "step1": "👤 Введи <b>ник в игре</b>:",
-        "step1_bad": "⚠️ Ник без ссылок и @. Повтори:",
-
-        # 2/12
-        "step2": "🧾 Укажи <b>настоящее имя</b>:",
-        "step2_bad": "⚠️ Имя без ссылок и @. Повтори:",
-
-        # 3/12
-        "step3": (
-            "📱 Укажи <b>контакт в Telegram</b>:\n"
-            "• @username\n\n"
-            "Если нет username — напиши <b>нет</b> или укажи способ связи."
-        ),
-        "use_my_tg": "👤 Использовать мой Telegram",
-        "step3_empty": "⚠️ Введи контакт или напиши <b>нет</b>.",
-        "no_username_alert": "У тебя нет @username в Telegram.",
-
-        # 4/12
-        "step4": "🌍 Укажи <b>страна / город</b> (коротко):",
-        "step4_bad": "⚠️ Без ссылок и @. Напиши страна/город:",
-
-        # 5/12
-        "step5": (
-            "🧙‍♂️ Укажи <b>профу / саб</b> (коротко):\n"
-            "<i>Пример: Necromancer / Bishop</i>"
-        ),
-        "step5_bad": "⚠️ Без ссылок и @. Повтори профу/саб:",
-
-        # 6/12
-        "step6": "⭐ Твой <b>LVL</b> в игре? (числом):",
-        "step6_nan": "⚠️ LVL должен быть числом. Например: <b>78</b>",
-        "step6_range": "⚠️ Укажи LVL от 1 до 99.",
-
-        # 7/12
-        "step7": "👑 Нобл есть?",
-        "noble_yes": "✅ Да",
-        "noble_no": "❌ Нет",
-        "noble_progress": "⏳ В процессе",
-
-        # 8/12
-        "step8": (
-            "⏰ Укажи <b>прайм</b> (дни + время):\n"
-            "<i>Пример: Пн–Пт 20:00–00:00, сб/вс больше</i>"
-        ),
-        "step8_bad": "⚠️ Без ссылок и @. Укажи прайм текстом:",
-
-        # 9/12
-        "step9": "🎙 Есть <b>микрофон</b> и готов слушать колл (TS/Discord)?",
-        "mic_yes": "🎙 Да",
-        "mic_no": "❌ Нет",
-
-        # 10/12
-        "step10": "📅 Готовность к <b>прайму/явке</b>:",
-        "ready_yes": "✅ Готов стабильно",
-        "ready_sometimes": "⚠️ Не всегда",
-        "ready_no": "❌ Не готов",
-
-        # 11/12
-        "step11": "🏰 Почему ты хочешь вступить именно в <b>SOBRANIEGOLD</b>? (1–2 предложения)",
-        "step11_bad": "⚠️ Без ссылок и @. Ответь 1–2 предложениями:",
-
-        # 12/12
-        "step12": "⚠️ Готов соблюдать <b>правила клана</b> и решения КЛа/ПЛа?",
-        "disc_yes": "✅ Да",
-        "disc_no": "❌ Нет",
-
-        "preview_title": "🧾 <b>Проверь заявку</b>",
-        "preview_submit": "Если всё верно — нажми <b>«Отправить»</b>.",
-        "confirm_hint": "Выбери действие кнопками ниже:",
-
-        "cooldown": f"Повторная заявка доступна через {COOLDOWN_HOURS} часов.",
-
-        "sent": (
-            "✅ <b>Анкета принята</b>\n\n"
-            "Рассмотрение занимает до <b>24 часов</b>.\n"
-            "Ответ поступит в Telegram при положительном решении."
-        ),
-        "disc_decline_user": (
-            "❌ <b>Заявка не принята</b>\n\n"
-            "Для вступления необходимо подтвердить готовность соблюдать правила клана."
-        ),
-        "private_only": "Подача заявки доступна только в личных сообщениях.",
-        "lang_already": "Язык уже выбран.",
-    },
-
-    "ua": {
-        "choose_lang": "🌍 Обери мову:",
-        "welcome": (
-            "👑 <b>SOBRANIEGOLD — офіційний набір</b>\n\n"
-            "Анкети розглядаються нашою командою.\n"
-            "Заповнення анкети — обов’язкова умова.\n\n"
-            "Натисни <b>«Подати заявку»</b> та заповни анкету.\n"
-            "⚠️ В анкеті <b>без посилань</b> і <b>@</b> (крім поля «Контакт TG»)."
-        ),
-        "btn_apply": "📝 Подати заявку",
-        "btn_info": "ℹ️ Інфо/Вимоги",
-        "info": (
-            "ℹ️ <b>Інфо</b>\n\n"
-            "Заповни анкету — офіцери її розглянуть.\n"
-            "При позитивному рішенні з тобою зв’яжуться в Telegram.\n\n"
-            "Натисни <b>«Подати заявку»</b>, щоб почати."
-        ),
-        "cancel": "❌ Скасувати",
-        "back": "⬅️ Назад",
-        "cancelled": "Ок, скасовано. Якщо захочеш — подай заявку знову.",
-        "restart": "🔄 Заповнити знову",
-        "send": "✅ Відправити",
-
-        "form": "📝 <b>Анкета</b>",
-
-        "step1": "👤 Введи <b>нік у грі</b>:",
-        "step1_bad": "⚠️ Нік без посилань і @. Повтори:",
-
-        "step2": "🧾 Вкажи <b>справжнє ім’я</b>:",
-        "step2_bad": "⚠️ Ім’я без посилань і @. Повтори:",
-
-        "step3": (
-            "📱 Вкажи <b>контакт у Telegram</b>:\n"
-            "• @username\n\n"
-            "Якщо немає username — напиши <b>ні</b> або спосіб зв’язку."
-        ),
-        "use_my_tg": "👤 Використати мій Telegram",
-        "step3_empty": "⚠️ Введи контакт або напиши <b>ні</b>.",
-        "no_username_alert": "У тебе немає @username у Telegram.",
-
-        "step4": "🌍 Вкажи <b>країна / місто</b> (коротко):",
-        "step4_bad": "⚠️ Без посилань і @. Напиши країна/місто:",
-
-        "step5": (
-            "🧙‍♂️ Вкажи <b>профу / саб</b> (коротко):\n"
-            "<i>Приклад: Necromancer / Bishop</i>"
-        ),
-        "step5_bad": "⚠️ Без посилань і @. Повтори профу/саб:",
-
-        "step6": "⭐ Твій <b>LVL</b> у грі? (числом):",
-        "step6_nan": "⚠️ LVL має бути числом. Наприклад: <b>78</b>",
-        "step6_range": "⚠️ Вкажи LVL від 1 до 99.",
-
-        "step7": "👑 Є нобл?",
-        "noble_yes": "✅ Так",
-        "noble_no": "❌ Ні",
-        "noble_progress": "⏳ В процесі",
-
-        "step8": (
-            "⏰ Вкажи <b>прайм</b> (дні + час):\n"
-            "<i>Приклад: Пн–Пт 20:00–00:00, сб/нд більше</i>"
-        ),
-        "step8_bad": "⚠️ Без посилань і @. Вкажи прайм текстом:",
-
-        "step9": "🎙 Є <b>мікрофон</b> і готовий слухати колл (TS/Discord)?",
-        "mic_yes": "🎙 Так",
-        "mic_no": "❌ Ні",
-
-        "step10": "📅 Готовність до <b>прайму/явки</b>:",
-        "ready_yes": "✅ Готовий стабільно",
-        "ready_sometimes": "⚠️ Не завжди",
-        "ready_no": "❌ Не готовий",
-
-        "step11": "🏰 Чому ти хочеш вступити саме в <b>SOBRANIEGOLD</b>? (1–2 речення)",
-        "step11_bad": "⚠️ Без посилань і @. Відповідай 1–2 реченнями:",
-
-        "step12": "⚠️ Готовий дотримуватись <b>правил клану</b> та рішень КЛа/ПЛа?",
-        "disc_yes": "✅ Так",
-        "disc_no": "❌ Ні",
-
-        "preview_title": "🧾 <b>Перевір заявку</b>",
-        "preview_submit": "Якщо все вірно — натисни <b>«Відправити»</b>.",
-        "confirm_hint": "Обери дію кнопками нижче:",
-
-        "cooldown": f"Повторна заявка буде доступна через {COOLDOWN_HOURS} год.",
-
-        "sent": (
-            "✅ <b>Анкета прийнята</b>\n\n"
-            "Розгляд займає до <b>24 годин</b>.\n"
-            "Відповідь прийде в Telegram при позитивному рішенні."
-        ),
-        "disc_decline_user": (
-            "❌ <b>Заявка не прийнята</b>\n\n"
-            "Для вступу потрібно підтвердити готовність дотримуватись правил клану."
-        ),
-        "private_only": "Подання заявки доступне лише в особистих повідомленнях.",
-        "lang_already": "Мову вже обрано.",
-    },
-
-    "en": {
-        "choose_lang": "🌍 Choose language:",
-        "welcome": (
-            "👑 <b>SOBRANIEGOLD — official recruitment</b>\n\n"
-            "Applications are reviewed by our team.\n"
-            "Filling the form is mandatory.\n\n"
-            "Press <b>“Apply”</b> and complete the form.\n"
-            "⚠️ No <b>links</b> and no <b>@</b> (except in “TG contact”)."
-        ),
-        "btn_apply": "📝 Apply",
-        "btn_info": "ℹ️ Info/Requirements",
-        "info": (
-            "ℹ️ <b>Info</b>\n\n"
-            "Fill the form — officers will review it.\n"
-            "If approved, you will be contacted in Telegram.\n\n"
-            "Press <b>“Apply”</b> to start."
-        ),
-        "cancel": "❌ Cancel",
-        "back": "⬅️ Back",
-        "cancelled": "Ok, cancelled. If you want — apply again.",
-        "restart": "🔄 Fill again",
-        "send": "✅ Send",
-
-        "form": "📝 <b>Application</b>",
-
-        "step1": "👤 Enter your <b>in-game nickname</b>:",
-        "step1_bad": "⚠️ No links and no @. Try again:",
-
-        "step2": "🧾 Enter your <b>real name</b>:",
-        "step2_bad": "⚠️ No links and no @. Try again:",
-
-        "step3": (
-            "📱 Enter your <b>Telegram contact</b>:\n"
-            "• @username\n\n"
-            "If you don't have a username — type <b>no</b> or your contact method."
-        ),
-        "use_my_tg": "👤 Use my Telegram",
-        "step3_empty": "⚠️ Enter contact or type <b>no</b>.",
-        "no_username_alert": "You don't have a Telegram @username.",
-
-        "step4": "🌍 Enter <b>country / city</b> (short):",
-        "step4_bad": "⚠️ No links and no @. Enter country/city:",
-
-        "step5": (
-            "🧙‍♂️ Enter your <b>class / sub</b> (short):\n"
-            "<i>Example: Necromancer / Bishop</i>"
-        ),
-        "step5_bad": "⚠️ No links and no @. Repeat class/sub:",
-
-        "step6": "⭐ Your <b>LVL</b> in game? (number):",
-        "step6_nan": "⚠️ LVL must be a number. Example: <b>78</b>",
-        "step6_range": "⚠️ Enter a LVL between 1 and 99.",
-
-        "step7": "👑 Do you have Noble?",
-        "noble_yes": "✅ Yes",
-        "noble_no": "❌ No",
-        "noble_progress": "⏳ In progress",
-
-        "step8": (
-            "⏰ Enter your <b>prime time</b> (days + time):\n"
-            "<i>Example: Mon–Fri 20:00–00:00, weekends more</i>"
-        ),
-        "step8_bad": "⚠️ No links and no @. Enter prime time:",
-
-        "step9": "🎙 Do you have a <b>microphone</b> and can listen to calls (TS/Discord)?",
-        "mic_yes": "🎙 Yes",
-        "mic_no": "❌ No",
-
-        "step10": "📅 Your <b>attendance readiness</b>:",
-        "ready_yes": "✅ Stable",
-        "ready_sometimes": "⚠️ Sometimes",
-        "ready_no": "❌ Not ready",
-
-        "step11": "🏰 Why do you want to join <b>SOBRANIEGOLD</b>? (1–2 sentences)",
-        "step11_bad": "⚠️ No links and no @. Answer in 1–2 sentences:",
-
-        "step12": "⚠️ Are you ready to follow <b>clan rules</b> and CL/PL decisions?",
-        "disc_yes": "✅ Yes",
-        "disc_no": "❌ No",
-
-        "preview_title": "🧾 <b>Check your form</b>",
-        "preview_submit": "If everything is correct — press <b>“Send”</b>.",
-        "confirm_hint": "Use the buttons below:",
-
-        "cooldown": f"You can re-apply after {COOLDOWN_HOURS} hours.",
-
-        "sent": (
-            "✅ <b>Application received</b>\n\n"
-            "Review can take up to <b>24 hours</b>.\n"
-            "You will be contacted in Telegram if approved."
-        ),
-        "disc_decline_user": (
-            "❌ <b>Application declined</b>\n\n"
-            "You must confirm readiness to follow clan rules."
-        ),
-        "private_only": "Application is available only in private messages.",
-        "lang_already": "Language already selected.",
-    },
-}
+# Строки лежат в locales/<lang>.json и компилируются в locales/catalogs.bin (см. i18n.py).
+# Язык появляется в боте, как только у него есть каталог.
+TXT = load_catalogs(code_paths=(os.path.abspath(__file__),))
+SUPPORTED_LANGS = TXT.langs
 
 def safe_lang(lang: str | None) -> str:
     return lang if lang in SUPPORTED_LANGS else "ru"
 
-def get_selected_lang(data: dict) -> str | None:
-    lang = data.get("lang")
-    return lang if lang in SUPPORTED_LANGS else None
+def lang_from_code(language_code: str | None) -> str:
+    """language_code из Telegram (IETF: uk, ru, en-US, ...) -> наш код языка."""
+    code = (language_code or "").split("-", 1)[0].lower()
+    if code == "uk":
+        return "ua"
+    return code if code in SUPPORTED_LANGS else "en"
 
 TOTAL_STEPS = 12
 
 # ===================== Keyboards =====================
 def k_lang():
     kb = InlineKeyboardBuilder()
-    kb.button(text="🇷🇺 RU Русский", callback_data="lang:ru")
-    kb.button(text="🇺🇦 UA Українська", callback_data="lang:ua")
-    kb.button(text="🇺🇸 EN English", callback_data="lang:en")
+    for lang in SUPPORTED_LANGS:
+        kb.button(text=TXT.buttons[lang], callback_data=f"lang:{lang}")
     kb.adjust(1)
     return kb.as_markup()
 
@@ -401,6 +558,7 @@ def k_start(lang: str):
     kb = InlineKeyboardBuilder()
     kb.button(text=t["btn_apply"], callback_data="start_form")
     kb.button(text=t["btn_info"], callback_data="info")
+    kb.button(text=t["btn_lang"], callback_data="choose_lang")
     kb.adjust(1)
     return kb.as_markup()
 
@@ -440,6 +598,15 @@ def k_use_my_tg(lang: str):
     kb.adjust(1, 2)
     return kb.as_markup()
 
+def k_photo(lang: str):
+    t = TXT[lang]
+    kb = InlineKeyboardBuilder()
+    kb.button(text=t["btn_skip"], callback_data="photo:skip")
+    kb.button(text=t["back"], callback_data="back")
+    kb.button(text=t["cancel"], callback_data="cancel")
+    kb.adjust(1)
+    return kb.as_markup()
+
 def k_noble(lang: str):
     t = TXT[lang]
     kb = InlineKeyboardBuilder()
@@ -496,6 +663,7 @@ class Form(StatesGroup):
     country = State()
     prof = State()
     lvl = State()
+    photo = State()
     noble = State()
     prime = State()
     mic = State()
@@ -511,6 +679,7 @@ FORM_ORDER = [
     Form.country,
     Form.prof,
     Form.lvl,
+    Form.photo,
     Form.noble,
     Form.prime,
     Form.mic,
@@ -518,129 +687,432 @@ FORM_ORDER = [
     Form.why,
     Form.discipline,
 ]
-STATE_TO_STEP = {st.state: i + 1 for i, st in enumerate(FORM_ORDER)}
+# Необязательные шаги идут под номером предыдущего и не входят в TOTAL_STEPS
+OPTIONAL_STEPS = {Form.photo.state}
+FORM_INDEX = {st.state: i for i, st in enumerate(FORM_ORDER)}
+STATE_TO_STEP = {}
+_step = 0
+for _st in FORM_ORDER:
+    if _st.state not in OPTIONAL_STEPS:
+        _step += 1
+    STATE_TO_STEP[_st.state] = _step
+
+# ===================== Duplicates =====================
+# Кириллица/цифры, которые выглядят как латиница: "Nеcrо" == "Necro", "B0ss" == "Boss"
+HOMOGLYPHS = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ї": "i", "ј": "j",
+    "0": "o", "1": "i", "l": "i", "|": "i", "3": "e", "4": "a", "5": "s", "$": "s",
+})
+NON_ALNUM_RE = re.compile(r"[\W_]+")
+
+MINHASH_BANDS = 8
+MINHASH_ROWS = 3
+MINHASH_PERMS = MINHASH_BANDS * MINHASH_ROWS
+MINHASH_PRIME = (1 << 61) - 1
+# Фиксированные коэффициенты: подписи пишутся на диск и должны совпадать между запусками
+_rng = [int.from_bytes(hashlib.blake2b(f"perm{i}".encode(), digest_size=8).digest(), "big") for i in range(MINHASH_PERMS * 2)]
+MINHASH_COEFFS = [(_rng[2 * i] % MINHASH_PRIME | 1, _rng[2 * i + 1] % MINHASH_PRIME) for i in range(MINHASH_PERMS)]
+SHINGLE = 4
+MIN_TEXT_FOR_LSH = 20     # "нравится" и прочие короткие ответы совпадают у честных людей
+DUP_TEXT_THRESHOLD = 0.6  # оценка Жаккара по подписи, с которой считаем текст скопированным
+EMPTY_SIG = array("I", [0] * MINHASH_PERMS)
+
+def fold_text(s: str) -> str:
+    s = unicodedata.normalize("NFKC", s or "").casefold().translate(HOMOGLYPHS)
+    return NON_ALNUM_RE.sub(" ", s).strip()
+
+def stable_hash64(s: str | bytes) -> int:
+    if isinstance(s, str):
+        s = s.encode()
+    return int.from_bytes(hashlib.blake2b(s, digest_size=8).digest(), "big")
+
+def nick_hash(nick: str) -> int:
+    # Пробелы/точки/подчёркивания и повторы букв не делают ник другим
+    folded = re.sub(r"(.)\1+", r"\1", fold_text(nick).replace(" ", ""))
+    return stable_hash64(folded) if folded else 0
+
+def minhash(text: str) -> array | None:
+    folded = fold_text(text)
+    if len(folded) < MIN_TEXT_FOR_LSH:
+        return None
+    shingles = {zlib.crc32(folded[i:i + SHINGLE].encode()) for i in range(len(folded) - SHINGLE + 1)}
+    return array("I", (
+        min((a * x + b) % MINHASH_PRIME for x in shingles) & 0xFFFFFFFF
+        for a, b in MINHASH_COEFFS
+    ))
+
+class HashSlots:
+    """
+    Прямоадресная таблица фиксированного размера: 64-битный хэш -> номер заявки (1..2^32).
+    Индекс слота — младшие биты, старшие 32 хранятся как метка для проверки.
+    При коллизии новая запись вытесняет старую — индекс "помнит" последние совпадения,
+    зато занимает 8 байт на слот, сколько бы заявок ни было.
+    """
+
+    def __init__(self, bits: int):
+        self.mask = (1 << bits) - 1
+        self.tags = array("I", bytes(4 << bits))
+        self.vals = array("I", bytes(4 << bits))
+
+    def get(self, h: int) -> int | None:
+        i = h & self.mask
+        v = self.vals[i]
+        return v if v and self.tags[i] == h >> 32 else None
+
+    def put(self, h: int, value: int):
+        i = h & self.mask
+        self.tags[i] = h >> 32
+        self.vals[i] = value
+
+class DuplicateIndex:
+    """
+    Индекс заявок для поиска альтов: номер заявки = позиция записи в файле.
+    На диске — только append-only записи (user_id, хэш ника, MinHash-подпись),
+    таблицы поиска собираются из них при старте.
+    Поиск — O(1) по нику и O(число полос) по LSH, без прохода по истории.
+    """
+
+    RECORD = struct.Struct(f"<qQ{MINHASH_PERMS}I")
+
+    def __init__(self, path: str, nick_bits: int = 20, lsh_bits: int = 21):
+        self.path = path
+        self.count = 0
+        self.users = array("q")
+        self.sigs = array("I")  # MINHASH_PERMS на заявку, нули — текст слишком короткий
+        self.by_nick = HashSlots(nick_bits)
+        self.by_band = HashSlots(lsh_bits)
+        self._file = None
+
+    @staticmethod
+    def band_keys(sig: array):
+        for band in range(MINHASH_BANDS):
+            rows = sig[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+            yield stable_hash64(bytes([band]) + rows.tobytes())
+
+    def _index(self, user_id: int, nh: int, sig: array | None):
+        self.count += 1
+        no = self.count
+        self.users.append(user_id)
+        self.sigs.extend(sig if sig is not None else EMPTY_SIG)
+        if nh:
+            self.by_nick.put(nh, no)
+        if sig is not None:
+            for key in self.band_keys(sig):
+                self.by_band.put(key, no)
+        return no
+
+    def load(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            whole = len(raw) // self.RECORD.size * self.RECORD.size
+            if whole != len(raw):
+                # Запись оборвана падением или полным диском — отрезаем, иначе следующие съедут
+                log.warning("Dropping %d torn bytes at the end of %s", len(raw) - whole, self.path)
+                os.truncate(self.path, whole)
+            for user_id, nh, *sig in self.RECORD.iter_unpack(memoryview(raw)[:whole]):
+                self._index(user_id, nh, array("I", sig) if any(sig) else None)
+        self._file = open(self.path, "ab")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def similarity(self, no: int, sig: array) -> float:
+        start = (no - 1) * MINHASH_PERMS
+        other = self.sigs[start:start + MINHASH_PERMS]
+        return sum(a == b for a, b in zip(sig, other)) / MINHASH_PERMS
+
+    def find(self, user_id: int, nh: int, sig: array | None) -> tuple[int, str] | None:
+        """(номер заявки, причина) для вероятного дубля от другого аккаунта."""
+        if nh:
+            no = self.by_nick.get(nh)
+            if no and self.users[no - 1] != user_id:
+                return no, "ник"
+        if sig is not None:
+            best, best_sim = 0, 0.0
+            for key in self.band_keys(sig):
+                no = self.by_band.get(key)
+                if no and no != best and self.users[no - 1] != user_id:
+                    sim = self.similarity(no, sig)
+                    if sim > best_sim:
+                        best, best_sim = no, sim
+            if best and best_sim >= DUP_TEXT_THRESHOLD:
+                return best, f"текст ~{round(best_sim * 100)}%"
+        return None
+
+    def add(self, user_id: int, nick: str, text: str) -> tuple[int, tuple[int, str] | None]:
+        """Проверяет заявку на дубль и добавляет её. Возвращает (номер заявки, дубль или None)."""
+        nh = nick_hash(nick)
+        sig = minhash(text)
+        dup = self.find(user_id, nh, sig)
+        no = self._index(user_id, nh, sig)
+        if self._file:
+            self._file.write(self.RECORD.pack(user_id, nh, *(sig if sig is not None else EMPTY_SIG)))
+            self._file.flush()
+        return no, dup
+
+dup_index = DuplicateIndex(os.path.join(DATA_DIR, "applications.idx"))
+
+# ===================== Applications log =====================
+EXPORT_FIELDS = (
+    "no", "ts", "user_id", "username", "lang", "discipline_ok",
+    "nick", "real_name", "contact", "country", "prof", "lvl",
+    "noble", "prime", "mic", "ready", "why", "photo_file_id",
+)
+
+class ApplicationLog:
+    """
+    Все заявки — JSONL, по строке на заявку, только дозапись.
+    Чтение — построчно, поэтому выгрузка любого размера не грузит историю в память.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, record: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def iter(self, accept=None):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Строка, оборванная падением посреди записи
+                    log.warning("Skipping undecodable line in %s", self.path)
+                    continue
+                if accept is None or accept(record):
+                    yield record
+
+applications = ApplicationLog(os.path.join(DATA_DIR, "applications.jsonl"))
+
+def export_filter(date_from: str | None = None, date_to: str | None = None,
+                  lang: str | None = None, lvl: str | None = None):
+    """
+    Предикат для выгрузки. Даты — YYYY-MM-DD включительно (по UTC+3), lvl — "70-99" или "80".
+    ValueError на кривой ввод.
+    """
+    d_from = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+    d_to = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+    if lang is not None and lang not in SUPPORTED_LANGS:
+        raise ValueError(f"unknown lang: {lang}")
+    if lvl:
+        lo, _, hi = lvl.partition("-")
+        lvl_min, lvl_max = int(lo), int(hi or lo)
+
+    def accept(record: dict) -> bool:
+        if lang is not None and record.get("lang") != lang:
+            return False
+        # Без фильтра по LVL в выгрузку идут и заявки без LVL (в журнале — "")
+        if lvl and not (lvl_min <= int(record.get("lvl") or 0) <= lvl_max):
+            return False
+        if d_from or d_to:
+            day = datetime.fromisoformat(record["ts"]).astimezone(ADMIN_TZ).date()
+            if (d_from and day < d_from) or (d_to and day > d_to):
+                return False
+        return True
+
+    return accept
+
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def csv_cell(value):
+    """Текст анкеты, похожий на формулу, — с апострофом: таблица покажет его как текст, а не выполнит."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def iter_export(fmt: str, accept):
+    """Строки выгрузки (str) по одной: заголовок CSV, затем записи."""
+    if fmt == "jsonl":
+        for record in applications.iter(accept):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        return
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush() -> str:
+        row = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return row
+
+    writer.writerow(EXPORT_FIELDS)
+    yield flush()
+    for record in applications.iter(accept):
+        writer.writerow([csv_cell(record.get(k, "")) for k in EXPORT_FIELDS])
+        yield flush()
+
+def write_export(path: str, fmt: str, accept) -> int:
+    """Пишет выгрузку в файл построчно, возвращает число заявок. Блокирующая — звать через to_thread."""
+    rows = 0
+    with open(path, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="") as f:
+        for chunk in iter_export(fmt, accept):
+            f.write(chunk)
+            rows += 1
+    return rows - 1 if fmt == "csv" else rows
 
 # ===================== Helpers =====================
-async def guard_private_message(m: Message, lang: str) -> bool:
-    if m.chat.type != "private":
-        await m.answer(TXT[lang]["private_only"], parse_mode="HTML")
-        return False
-    return True
+NOBLE_RU = ("да", "нет", "в процессе")
+MIC_RU = ("да", "нет")
+READY_RU = ("готов стабильно", "не всегда", "не готов")
+
+def form_of(state: FSMContext) -> Application:
+    return storage.get_form(state.key)
+
+async def reset_form(state: FSMContext, lang: str):
+    """Сбросить анкету и шаг, оставив выбранный язык."""
+    await state.clear()
+    form_of(state).lang = lang
 
-def fmt_preview(lang: str, data: dict) -> str:
+def choice_label(lang: str, prefix: str, choices: tuple[str, ...], code: int | None) -> str:
+    """Код выбора -> подпись кнопки на языке анкеты, без эмодзи."""
+    if code is None:
+        return "-"
+    return TXT[lang][f"{prefix}_{choices[code]}"].split(" ", 1)[-1]
+
+def field(value) -> str:
+    return "-" if value is None else str(value)
+
+@lru_cache(maxsize=None)
+def no_contact_words() -> frozenset[str]:
+    """
+    Ответы "контакта нет" на шаге 3: contact_none и contact_none_words всех каталогов —
+    "ні" в русской анкете или "нет" в английской тоже значат, что контакта нет.
+    """
+    words = set()
+    for lang in SUPPORTED_LANGS:
+        t = TXT[lang]
+        words.update(w.strip().casefold() for w in t["contact_none_words"].split(","))
+        words.add(t["contact_none"].casefold())
+    return frozenset(w for w in words if w)
+
+def contact_ru(contact: str | None) -> str:
+    if contact is None:
+        return "-"
+    return "нет" if contact.strip().casefold() in no_contact_words() else contact
+
+def fmt_preview(lang: str, form: Application) -> str:
     t = TXT[lang]
-    label = {
-        "ru": (
-            "👤 Ник","🧾 Имя","📱 Контакт TG","🌍 Страна/город","🧙‍♂️ Профа/Саб","⭐ LVL",
-            "👑 Нобл","⏰ Прайм","🎙 Микрофон","📅 Готовность","🏰 Почему клан","⚠️ Дисциплина",
-        ),
-        "ua": (
-            "👤 Нік","🧾 Ім’я","📱 Контакт TG","🌍 Країна/місто","🧙‍♂️ Профа/Саб","⭐ LVL",
-            "👑 Нобл","⏰ Прайм","🎙 Мікрофон","📅 Готовність","🏰 Чому клан","⚠️ Дисципліна",
-        ),
-        "en": (
-            "👤 Nick","🧾 Name","📱 TG contact","🌍 Country/City","🧙‍♂️ Class/Sub","⭐ LVL",
-            "👑 Noble","⏰ Prime time","🎙 Mic","📅 Readiness","🏰 Why clan","⚠️ Discipline",
-        ),
-    }[lang]
+    if form.discipline is None:
+        discipline = "-"
+    else:
+        discipline = t["disc_confirmed"] if form.discipline else t["disc_not_confirmed"]
 
     return (
         f"{t['preview_title']}\n\n"
-        f"1) {label[0]}: <b>{data.get('nick','-')}</b>\n"
-        f"2) {label[1]}: <b>{data.get('real_name','-')}</b>\n"
-        f"3) {label[2]}: <b>{data.get('contact','-')}</b>\n"
-        f"4) {label[3]}: <b>{data.get('country','-')}</b>\n"
-        f"5) {label[4]}: <b>{data.get('prof','-')}</b>\n"
-        f"6) {label[5]}: <b>{data.get('lvl','-')}</b>\n"
-        f"7) {label[6]}: <b>{data.get('noble','-')}</b>\n"
-        f"8) {label[7]}: <b>{data.get('prime','-')}</b>\n"
-        f"9) {label[8]}: <b>{data.get('mic','-')}</b>\n"
-        f"10) {label[9]}: <b>{data.get('ready','-')}</b>\n"
-        f"11) {label[10]}: <b>{data.get('why','-')}</b>\n"
-        f"12) {label[11]}: <b>{data.get('discipline','-')}</b>\n\n"
+        f"1) {t['label_nick']}: <b>{field(form.nick)}</b>\n"
+        f"2) {t['label_real_name']}: <b>{field(form.real_name)}</b>\n"
+        f"3) {t['label_contact']}: <b>{field(form.contact)}</b>\n"
+        f"4) {t['label_country']}: <b>{field(form.country)}</b>\n"
+        f"5) {t['label_prof']}: <b>{field(form.prof)}</b>\n"
+        f"6) {t['label_lvl']}: <b>{field(form.lvl)}</b>\n"
+        f"    {t['label_photo']}: <b>{t['photo_yes'] if form.photo_id else t['photo_no']}</b>\n"
+        f"7) {t['label_noble']}: <b>{choice_label(lang, 'noble', NOBLE_CHOICES, form.noble)}</b>\n"
+        f"8) {t['label_prime']}: <b>{field(form.prime)}</b>\n"
+        f"9) {t['label_mic']}: <b>{choice_label(lang, 'mic', MIC_CHOICES, form.mic)}</b>\n"
+        f"10) {t['label_ready']}: <b>{choice_label(lang, 'ready', READY_CHOICES, form.ready)}</b>\n"
+        f"11) {t['label_why']}: <b>{field(form.why)}</b>\n"
+        f"12) {t['label_discipline']}: <b>{discipline}</b>\n\n"
         f"{t['preview_submit']}"
     )
 
-def to_ru_value(field: str, value: str, user_lang: str) -> str:
-    v = (value or "").strip().lower()
-    ul = user_lang
-
-    if field == "contact":
-        if v in {"no", "none", "нет", "ні", "нема"}:
-            return "нет"
-        return value
-
-    if field == "noble":
-        maps = {
-            "ru": {"да": "да", "нет": "нет", "в процессе": "в процессе"},
-            "ua": {"так": "да", "ні": "нет", "в процесі": "в процессе"},
-            "en": {"yes": "да", "no": "нет", "in progress": "в процессе"},
-        }
-        return maps.get(ul, {}).get(v, value)
-
-    if field == "mic":
-        maps = {
-            "ru": {"да": "да", "нет": "нет"},
-            "ua": {"так": "да", "ні": "нет"},
-            "en": {"yes": "да", "no": "нет"},
-        }
-        return maps.get(ul, {}).get(v, value)
-
-    if field == "ready":
-        maps = {
-            "ru": {"готов стабильно": "готов стабильно", "не всегда": "не всегда", "не готов": "не готов"},
-            "ua": {"готовий стабільно": "готов стабильно", "не завжди": "не всегда", "не готовий": "не готов"},
-            "en": {"stable": "готов стабильно", "sometimes": "не всегда", "not ready": "не готов"},
-        }
-        return maps.get(ul, {}).get(v, value)
-
-    return value
-
-async def send_admin_application_ru(user, data: dict, discipline_ok: bool):
+async def send_admin_application_ru(user, form: Application):
     now = datetime.now(timezone.utc)
     tz3 = timezone(timedelta(hours=3))
     ts = now.astimezone(tz3).strftime("%Y-%m-%d %H:%M")
 
-    user_lang = safe_lang(data.get("lang"))
-    lang_label = {"ru": "RU (Русский)", "ua": "UA (Українська)", "en": "EN (English)"}[user_lang]
+    user_lang = safe_lang(form.lang)
+    lang_label = f"{user_lang.upper()} ({TXT[user_lang]['lang_name']})"
 
+    discipline_ok = bool(form.discipline)
     disc_icon = "✅" if discipline_ok else "❌"
     disc_text = "подтверждена" if discipline_ok else "НЕ подтверждена"
 
     tg_username = f"@{user.username}" if getattr(user, "username", None) else "—"
 
-    contact_ru = to_ru_value("contact", str(data.get("contact", "-")), user_lang)
-    noble_ru = to_ru_value("noble", str(data.get("noble", "-")), user_lang)
-    mic_ru = to_ru_value("mic", str(data.get("mic", "-")), user_lang)
-    ready_ru = to_ru_value("ready", str(data.get("ready", "-")), user_lang)
+    contact = contact_ru(form.contact)
+    noble_ru = "-" if form.noble is None else NOBLE_RU[form.noble]
+    mic_ru = "-" if form.mic is None else MIC_RU[form.mic]
+    ready_ru = "-" if form.ready is None else READY_RU[form.ready]
+
+    chat_id, thread_id = admin_routes.route(user_lang, form.lvl, form.prof)
+    # Очередь чата переполнена — QueueFull до номера и записи в журнал: анкета вернётся
+    # пользователю, а в журнале, индексе дублей и выгрузке не останется заявки-сироты
+    admin_outbox.check_room(chat_id)
+
+    app_no, dup = dup_index.add(
+        user.id,
+        form.nick or "",
+        f"{form.why or ''} {form.prime or ''}",
+    )
+    dup_line = f"⚠️ Вероятный дубль заявки <b>№{dup[0]}</b> ({dup[1]})\n\n" if dup else ""
+
+    applications.append({
+        "no": app_no,
+        "ts": now.isoformat(),
+        "user_id": user.id,
+        "username": getattr(user, "username", None) or "",
+        "lang": user_lang,
+        "discipline_ok": discipline_ok,
+        "nick": form.nick or "",
+        "real_name": form.real_name or "",
+        "contact": contact,
+        "country": form.country or "",
+        "prof": form.prof or "",
+        "lvl": "" if form.lvl is None else form.lvl,
+        "noble": noble_ru,
+        "prime": form.prime or "",
+        "mic": mic_ru,
+        "ready": ready_ru,
+        "why": form.why or "",
+        "photo_file_id": form.photo_id or "",
+    })
 
     msg = (
-        "🧾 <b>Новая заявка (SOBRANIEGOLD)</b>\n\n"
+        f"🧾 <b>Новая заявка №{app_no} (SOBRANIEGOLD)</b>\n\n"
+        f"{dup_line}"
         f"👤 Игрок: <b>{user.full_name}</b>\n"
         f"🆔 ID: <code>{user.id}</code>\n"
         f"📎 TG username: <b>{tg_username}</b>\n"
         f"🌍 Язык анкеты: <b>{lang_label}</b>\n\n"
         f"{disc_icon} Дисциплина: <b>{disc_text}</b>\n\n"
-        f"1) 👤 Ник: <b>{data.get('nick','-')}</b>\n"
-        f"2) 🧾 Имя: <b>{data.get('real_name','-')}</b>\n"
-        f"3) 📱 Контакт TG (из анкеты): <b>{contact_ru}</b>\n"
-        f"4) 🌍 Страна/город: <b>{data.get('country','-')}</b>\n"
-        f"5) 🧙‍♂️ Профа/Саб: <b>{data.get('prof','-')}</b>\n"
-        f"6) ⭐ LVL: <b>{data.get('lvl','-')}</b>\n"
+        f"1) 👤 Ник: <b>{field(form.nick)}</b>\n"
+        f"2) 🧾 Имя: <b>{field(form.real_name)}</b>\n"
+        f"3) 📱 Контакт TG (из анкеты): <b>{contact}</b>\n"
+        f"4) 🌍 Страна/город: <b>{field(form.country)}</b>\n"
+        f"5) 🧙‍♂️ Профа/Саб: <b>{field(form.prof)}</b>\n"
+        f"6) ⭐ LVL: <b>{field(form.lvl)}</b>\n"
+        f"    📸 Скриншот: <b>{'ниже' if form.photo_id else 'нет'}</b>\n"
         f"7) 👑 Нобл: <b>{noble_ru}</b>\n"
-        f"8) ⏰ Прайм: <b>{data.get('prime','-')}</b>\n"
+        f"8) ⏰ Прайм: <b>{field(form.prime)}</b>\n"
         f"9) 🎙 Микрофон: <b>{mic_ru}</b>\n"
         f"10) 📅 Готовность: <b>{ready_ru}</b>\n"
-        f"11) 🏰 Почему наш клан: <b>{data.get('why','-')}</b>\n\n"
+        f"11) 🏰 Почему наш клан: <b>{field(form.why)}</b>\n\n"
         f"⏱ {ts} (UTC+3)"
     )
 
-    await bot.send_message(
-        ADMIN_CHAT_ID,
-        msg,
-        parse_mode="HTML",
-        reply_markup=k_admin_contact(user.id),
-    )
+    # Отправляет фоновая очередь чата; место проверено выше, await с тех пор не было
+    admin_outbox.put({
+        "chat_id": chat_id,
+        "thread_id": thread_id,
+        "text": msg,
+        "user_id": user.id,
+        "app_no": app_no,
+        "photo_id": form.photo_id,
+        "photo_kind": None if form.photo_id is None else PHOTO_KINDS[form.photo_kind],
+    })
 
 def build_step_text(lang: str, step_no: int, key: str) -> str:
     return f"{TXT[lang]['form']} ({step_no}/{TOTAL_STEPS})\n\n{TXT[lang][key]}"
@@ -668,6 +1140,9 @@ async def show_step_by_state(cq_or_msg, state: FSMContext, lang: str, target_sta
     elif st == Form.lvl.state:
         text = build_step_text(lang, step_no, "step6")
         kb = k_cancel_back(lang, with_back=True)
+    elif st == Form.photo.state:
+        text = build_step_text(lang, step_no, "step6_photo")
+        kb = k_photo(lang)
     elif st == Form.noble.state:
         text = build_step_text(lang, step_no, "step7")
         kb = k_noble(lang)
@@ -694,136 +1169,358 @@ async def show_step_by_state(cq_or_msg, state: FSMContext, lang: str, target_sta
 
     if isinstance(cq_or_msg, CallbackQuery):
         if edit:
-            await cq_or_msg.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+            await edit_text_cached(cq_or_msg.message, text, kb)
         else:
             await cq_or_msg.message.answer(text, reply_markup=kb, parse_mode="HTML")
     else:
         await cq_or_msg.answer(text, reply_markup=kb, parse_mode="HTML")
 
+# ===================== Flood control =====================
+# (ёмкость, пополнение токенов в секунду) — отдельно для сообщений и колбэков
+THROTTLE_RATES = {"message": (8, 1.0), "callback_query": (10, 2.0)}
+THROTTLE_TABLE_SIZE = 50_000
+MUTE_AFTER = 20           # столько отброшенных апдейтов подряд -> временный мьют
+MUTE_SECONDS = 300
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp", "strikes")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.stamp = now
+        self.strikes = 0
+
+class ThrottleMiddleware(BaseMiddleware):
+    """
+    Самый внешний фильтр: token bucket на пользователя отдельно для сообщений и колбэков.
+    Лишние апдейты молча выбрасываются до FSM — ни чтения состояния, ни ответа.
+    Таблица бакетов и мьют-лист ограничены по размеру (LRU).
+    """
+
+    def __init__(self):
+        self.buckets: OrderedDict[tuple[int, str], TokenBucket] = OrderedDict()
+        self.muted: OrderedDict[int, float] = OrderedDict()  # user_id -> до какого времени
+
+    def allow(self, user_id: int, kind: str, now: float) -> bool:
+        until = self.muted.get(user_id)
+        if until is not None:
+            if now < until:
+                STATS["updates_muted_dropped"] += 1
+                return False
+            del self.muted[user_id]
+
+        capacity, rate = THROTTLE_RATES[kind]
+        key = (user_id, kind)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(capacity, now)
+            if len(self.buckets) > THROTTLE_TABLE_SIZE:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.stamp) * rate)
+            bucket.stamp = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.strikes = 0
+            return True
+
+        STATS["updates_throttled"] += 1
+        bucket.strikes += 1
+        if bucket.strikes >= MUTE_AFTER:
+            bucket.strikes = 0
+            self.muted[user_id] = now + MUTE_SECONDS
+            self.muted.move_to_end(user_id)
+            if len(self.muted) > THROTTLE_TABLE_SIZE:
+                self.muted.popitem(last=False)
+            STATS["users_muted"] += 1
+        return False
+
+    async def __call__(self, handler, event: Update, data: dict):
+        user = data.get("event_from_user")
+        kind = event.event_type
+        if user is not None and kind in THROTTLE_RATES:
+            if not self.allow(user.id, kind, time.monotonic()):
+                return None
+        return await handler(event, data)
+
+# ===================== Non-private chats =====================
+GROUP_NOTICE_INTERVAL = 3600  # не чаще одного "только в личке" на группу в час
+GROUP_NOTICE_TABLE_SIZE = 10_000
+
+class PrivateChatMiddleware(BaseMiddleware):
+    """
+    Анкета — только в личке. Апдейты из групп (кроме админ-чата) отсекаются здесь,
+    до FSM: ни лока пользователя, ни чтения состояния, ни хэндлера.
+    На /start в группе — одно "только в личке" на группу в час.
+    """
+
+    def __init__(self):
+        self.noticed: OrderedDict[int, float] = OrderedDict()  # chat_id -> когда писали
+
+    def _notice_due(self, chat_id: int, now: float) -> bool:
+        last = self.noticed.get(chat_id)
+        if last is not None and now - last < GROUP_NOTICE_INTERVAL:
+            return False
+        self.noticed[chat_id] = now
+        self.noticed.move_to_end(chat_id)
+        if len(self.noticed) > GROUP_NOTICE_TABLE_SIZE:
+            self.noticed.popitem(last=False)
+        return True
+
+    async def __call__(self, handler, event: Update, data: dict):
+        chat = data.get("event_chat")
+        if chat is None or chat.type == "private" or chat.id == ADMIN_CHAT_ID:
+            return await handler(event, data)
+
+        STATS["group_updates_filtered"] += 1
+        m = event.message
+        if m is not None and (m.text or "").startswith("/start") and self._notice_due(chat.id, time.monotonic()):
+            user = data.get("event_from_user")
+            lang = lang_from_code(user.language_code if user else None)
+            with suppress(TelegramBadRequest, TelegramForbiddenError):
+                await m.answer(TXT[lang]["private_only"], parse_mode="HTML")
+        return None
+
+# ===================== Admission =====================
+class PriorityGate:
+    """
+    Семафор с приоритетами: при освобождении слота первым проходит
+    ожидающий с меньшим priority (при равных — кто раньше пришёл).
+    """
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+
+    async def acquire(self, priority: int):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Слот уже был отдан нам — передаём дальше
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._free += 1
+
+class AdmissionMiddleware(BaseMiddleware):
+    """
+    Стоит до FSM: при перегрузке отвечает заготовленным "занято" и не запускает хэндлер.
+    """
+
+    def __init__(self):
+        self.inflight = 0
+
+    async def __call__(self, handler, event: Update, data: dict):
+        if self.inflight >= SHED_THRESHOLD:
+            STATS["updates_shed"] += 1
+            user = data.get("event_from_user")
+            # Ответ "занято" — без чтения FSM и без хэндлера
+            text = TXT[lang_from_code(user.language_code if user else None)]["busy"]
+            if event.callback_query:
+                await safe_cq_answer(event.callback_query, text)
+            elif event.message and event.message.chat.type == "private":
+                with suppress(TelegramBadRequest):
+                    await event.message.answer(text)
+            return None
+
+        self.inflight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.inflight -= 1
+
+class PriorityGateMiddleware(BaseMiddleware):
+    """
+    Стоит после FSM (лок пользователя уже взят, поэтому порядок его апдейтов не меняется).
+    Ограничивает число одновременных хэндлеров; колбэки пропускает вперёд текстовых шагов
+    и выбрасывает те, что прождали дольше окна ответа Telegram.
+    """
+
+    def __init__(self, slots: int):
+        self.gate = PriorityGate(slots)
+
+    async def __call__(self, handler, event: Update, data: dict):
+        is_callback = event.callback_query is not None
+        await self.gate.acquire(0 if is_callback else 1)
+        try:
+            received_at = data.get("received_at")
+            if is_callback and received_at and time.monotonic() - received_at > CALLBACK_MAX_AGE:
+                # Ответить уже нельзя, а форму пользователь, скорее всего, бросил
+                STATS["callbacks_stale_dropped"] += 1
+                return None
+            return await handler(event, data)
+        finally:
+            self.gate.release()
+
+admission = AdmissionMiddleware()
+priority_gate = PriorityGateMiddleware(HANDLER_SLOTS)
+# Порядок важен: флуд-контроль -> только личка -> дешёвый отказ при перегрузке ->
+# лок пользователя и чтение состояния (FSM) -> слот хэндлера
+dp.update.outer_middleware(ThrottleMiddleware())
+dp.update.outer_middleware(PrivateChatMiddleware())
+dp.update.outer_middleware(admission)
+dp.update.outer_middleware(dp.fsm)
+dp.update.outer_middleware(priority_gate)
+
+# ===================== Cooldown / ban =====================
+def submit_blocked_text(user_id: int, lang: str, now: datetime) -> str | None:
+    """Текст отказа, если пользователю сейчас нельзя подавать заявку, иначе None."""
+    if user_id in BANNED_USER_IDS:
+        return TXT[lang]["banned"]
+    left = last_submit.remaining(user_id, now)
+    if left is None:
+        return None
+    minutes = max(int(left.total_seconds() // 60), 1)
+    return TXT[lang]["cooldown"].format(h=minutes // 60, m=minutes % 60)
+
+# ===================== Routers =====================
+# Группы отсекает PrivateChatMiddleware ещё до FSM; фильтр роутера не пускает
+# в анкету сообщения админ-чата, который middleware пропускает для admin_router.
+form_router = Router(name="form")
+form_router.message.filter(F.chat.type == "private")
+form_router.callback_query.filter(F.message.chat.type == "private")
+
 # ===================== /start =====================
-@dp.message(CommandStart())
+@form_router.message(CommandStart())
 async def cmd_start(m: Message, state: FSMContext):
-    await state.clear()
+    # Язык берём из клиента Telegram и сразу показываем приветствие; сменить — кнопкой
+    lang = lang_from_code(m.from_user.language_code if m.from_user else None)
+    await reset_form(state, lang)
     await state.set_state(Form.lang)
-    await m.answer(TXT["ru"]["choose_lang"], reply_markup=k_lang(), parse_mode="HTML")
+    await m.answer(TXT[lang]["welcome"], reply_markup=k_start(lang), parse_mode="HTML")
 
 # ===================== Language select =====================
-@dp.callback_query(F.data.startswith("lang:"))
+@form_router.callback_query(F.data.startswith("lang:"))
 async def cb_lang(cq: CallbackQuery, state: FSMContext):
     lang = safe_lang(cq.data.split(":", 1)[1])
 
-    data = await state.get_data()
-    selected = get_selected_lang(data)
-
-    if selected == lang:
+    form = form_of(state)
+    if form.lang == lang:
         await safe_cq_answer(cq, TXT[lang]["lang_already"])
-        return
-
-    await state.update_data(lang=lang)
+    else:
+        await safe_cq_answer(cq)
+        form.lang = lang
 
     try:
-        await cq.message.edit_text(TXT[lang]["welcome"], reply_markup=k_start(lang), parse_mode="HTML")
-    except Exception:
+        await edit_text_cached(cq.message, TXT[lang]["welcome"], k_start(lang))
+    except TelegramBadRequest:
+        # Сообщение нельзя редактировать (слишком старое/удалено) — шлём новое
         await cq.message.answer(TXT[lang]["welcome"], reply_markup=k_start(lang), parse_mode="HTML")
 
+@form_router.callback_query(F.data == "choose_lang")
+async def cb_choose_lang(cq: CallbackQuery, state: FSMContext):
     await safe_cq_answer(cq)
+    lang = safe_lang(form_of(state).lang)
+    await edit_text_cached(cq.message, TXT[lang]["choose_lang"], k_lang())
 
 # ===================== Back button =====================
-@dp.callback_query(F.data == "back")
+@form_router.callback_query(F.data == "back")
 async def cb_back(cq: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
     cur = await state.get_state()
 
     if cur == Form.confirm.state:
         await show_step_by_state(cq, state, lang, Form.discipline, edit=True)
-        await safe_cq_answer(cq)
         return
 
-    if cur not in STATE_TO_STEP:
-        await state.clear()
-        await state.update_data(lang=lang)
-        await cq.message.edit_text(TXT[lang]["welcome"], reply_markup=k_start(lang), parse_mode="HTML")
-        await safe_cq_answer(cq)
+    cur_idx = FORM_INDEX.get(cur)
+    if cur_idx is None or cur_idx == 0:
+        await reset_form(state, lang)
+        await edit_text_cached(cq.message, TXT[lang]["welcome"], k_start(lang))
         return
 
-    cur_idx = STATE_TO_STEP[cur]
-    if cur_idx <= 1:
-        await state.clear()
-        await state.update_data(lang=lang)
-        await cq.message.edit_text(TXT[lang]["welcome"], reply_markup=k_start(lang), parse_mode="HTML")
-        await safe_cq_answer(cq)
-        return
-
-    prev_state = FORM_ORDER[cur_idx - 2]
+    prev_state = FORM_ORDER[cur_idx - 1]
     await show_step_by_state(cq, state, lang, prev_state, edit=True)
-    await safe_cq_answer(cq)
 
 # ===================== Menu =====================
-@dp.callback_query(F.data == "info")
+@form_router.callback_query(F.data == "info")
 async def cb_info(cq: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-    await cq.message.edit_text(TXT[lang]["info"], reply_markup=k_info(lang), parse_mode="HTML")
     await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
+    await edit_text_cached(cq.message, TXT[lang]["info"], k_info(lang))
 
-@dp.callback_query(F.data == "start_form")
+@form_router.callback_query(F.data == "start_form")
 async def cb_start_form(cq: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.clear()
-    await state.update_data(lang=lang)
+    # Проверяем до начала анкеты, а не после 12 шагов
+    blocked = submit_blocked_text(cq.from_user.id, lang, datetime.now(timezone.utc))
+    if blocked:
+        await safe_cq_answer(cq, blocked, show_alert=True)
+        return
 
-    await cq.message.edit_text(
+    await safe_cq_answer(cq)
+    await reset_form(state, lang)
+
+    await edit_text_cached(
+        cq.message,
         build_step_text(lang, 1, "step1"),
-        reply_markup=k_cancel_back(lang, with_back=True),
-        parse_mode="HTML",
+        k_cancel_back(lang, with_back=True),
     )
     await state.set_state(Form.nick)
-    await safe_cq_answer(cq)
 
-@dp.callback_query(F.data == "cancel")
+@form_router.callback_query(F.data == "cancel")
 async def cb_cancel(cq: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.clear()
-    await state.update_data(lang=lang)
+    await reset_form(state, lang)
 
-    await cq.message.edit_text(TXT[lang]["cancelled"], reply_markup=k_start(lang), parse_mode="HTML")
-    await safe_cq_answer(cq)
+    await edit_text_cached(cq.message, TXT[lang]["cancelled"], k_start(lang))
 
-@dp.callback_query(F.data == "restart")
+@form_router.callback_query(F.data == "restart")
 async def cb_restart(cq: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.clear()
-    await state.update_data(lang=lang)
+    # Проверяем до начала анкеты, а не после 12 шагов
+    blocked = submit_blocked_text(cq.from_user.id, lang, datetime.now(timezone.utc))
+    if blocked:
+        await safe_cq_answer(cq, blocked, show_alert=True)
+        return
+
+    await safe_cq_answer(cq)
+    await reset_form(state, lang)
 
-    await cq.message.edit_text(
+    await edit_text_cached(
+        cq.message,
         build_step_text(lang, 1, "step1"),
-        reply_markup=k_cancel_back(lang, with_back=True),
-        parse_mode="HTML",
+        k_cancel_back(lang, with_back=True),
     )
     await state.set_state(Form.nick)
-    await safe_cq_answer(cq)
 
 # ===================== Step 1 Nick =====================
-@dp.message(Form.nick)
+@form_router.message(Form.nick)
 async def step_nick(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     if bad_text_general(m.text):
         await m.answer(TXT[lang]["step1_bad"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(nick=m.text.strip()[:40])
+    form.nick = m.text.strip()[:40]
 
     await m.answer(
         build_step_text(lang, 2, "step2"),
@@ -833,19 +1530,16 @@ async def step_nick(m: Message, state: FSMContext):
     await state.set_state(Form.real_name)
 
 # ===================== Step 2 Real name =====================
-@dp.message(Form.real_name)
+@form_router.message(Form.real_name)
 async def step_real_name(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     if bad_text_general(m.text):
         await m.answer(TXT[lang]["step2_bad"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(real_name=m.text.strip()[:40])
+    form.real_name = m.text.strip()[:40]
 
     kb = k_cancel_back(lang, with_back=True)
     if m.from_user and m.from_user.username:
@@ -858,51 +1552,47 @@ async def step_real_name(m: Message, state: FSMContext):
     )
     await state.set_state(Form.contact)
 
-@dp.callback_query(F.data == "use_my_tg")
+@form_router.callback_query(F.data == "use_my_tg")
 async def cb_use_my_tg(cq: CallbackQuery, state: FSMContext):
     if await state.get_state() != Form.contact.state:
         await safe_cq_answer(cq)
         return
 
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     username = cq.from_user.username
     if not username:
         await safe_cq_answer(cq, TXT[lang]["no_username_alert"], show_alert=True)
         return
 
-    await state.update_data(contact=f"@{username}")
+    await safe_cq_answer(cq)
+    form.contact = f"@{username}"
 
-    await cq.message.edit_text(
+    await edit_text_cached(
+        cq.message,
         build_step_text(lang, 4, "step4"),
-        reply_markup=k_cancel_back(lang, with_back=True),
-        parse_mode="HTML",
+        k_cancel_back(lang, with_back=True),
     )
     await state.set_state(Form.country)
-    await safe_cq_answer(cq)
 
 # ===================== Step 3 Contact =====================
-@dp.message(Form.contact)
+@form_router.message(Form.contact)
 async def step_contact(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     t = (m.text or "").strip()
     if not t:
         await m.answer(TXT[lang]["step3_empty"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    low = t.lower()
-    if low in {"нет", "no", "none", "ні", "нема"}:
-        contact = {"ru": "нет", "ua": "ні", "en": "no"}[lang]
+    if t.casefold() in no_contact_words():
+        contact = TXT[lang]["contact_none"]
     else:
         contact = normalize_contact(t)
 
-    await state.update_data(contact=contact)
+    form.contact = contact
 
     await m.answer(
         build_step_text(lang, 4, "step4"),
@@ -912,19 +1602,16 @@ async def step_contact(m: Message, state: FSMContext):
     await state.set_state(Form.country)
 
 # ===================== Step 4 Country =====================
-@dp.message(Form.country)
+@form_router.message(Form.country)
 async def step_country(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     if bad_text_general(m.text):
         await m.answer(TXT[lang]["step4_bad"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(country=m.text.strip()[:64])
+    form.country = m.text.strip()[:64]
 
     await m.answer(
         build_step_text(lang, 5, "step5"),
@@ -934,19 +1621,16 @@ async def step_country(m: Message, state: FSMContext):
     await state.set_state(Form.prof)
 
 # ===================== Step 5 Prof =====================
-@dp.message(Form.prof)
+@form_router.message(Form.prof)
 async def step_prof(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     if bad_text_general(m.text):
         await m.answer(TXT[lang]["step5_bad"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(prof=m.text.strip()[:80])
+    form.prof = m.text.strip()[:80]
 
     await m.answer(
         build_step_text(lang, 6, "step6"),
@@ -956,13 +1640,10 @@ async def step_prof(m: Message, state: FSMContext):
     await state.set_state(Form.lvl)
 
 # ===================== Step 6 Level =====================
-@dp.message(Form.lvl)
+@form_router.message(Form.lvl)
 async def step_lvl(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     t = (m.text or "").strip()
     if not t.isdigit():
@@ -974,7 +1655,39 @@ async def step_lvl(m: Message, state: FSMContext):
         await m.answer(TXT[lang]["step6_range"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(lvl=lvl_int)
+    form.lvl = lvl_int
+
+    await m.answer(
+        build_step_text(lang, 6, "step6_photo"),
+        reply_markup=k_photo(lang),
+        parse_mode="HTML",
+    )
+    await state.set_state(Form.photo)
+
+# ===================== Step 6b Screenshot (optional) =====================
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+@form_router.message(Form.photo)
+async def step_photo(m: Message, state: FSMContext):
+    form = form_of(state)
+    lang = safe_lang(form.lang)
+
+    # Всё по метаданным апдейта: файл не скачиваем, храним только его id в Telegram
+    if m.photo:
+        media, kind = m.photo[-1], "photo"  # самый крупный размер
+    elif m.document and m.document.mime_type in PHOTO_MIME_TYPES:
+        media, kind = m.document, "document"
+    else:
+        await m.answer(TXT[lang]["step6_photo_bad"], reply_markup=k_photo(lang), parse_mode="HTML")
+        return
+    if (media.file_size or 0) > PHOTO_MAX_BYTES:
+        await m.answer(TXT[lang]["step6_photo_big"], reply_markup=k_photo(lang), parse_mode="HTML")
+        return
+
+    form.photo_id = media.file_id
+    form.photo_uid = media.file_unique_id
+    form.photo_kind = PHOTO_KINDS.index(kind)
 
     await m.answer(
         build_step_text(lang, 7, "step7"),
@@ -983,49 +1696,55 @@ async def step_lvl(m: Message, state: FSMContext):
     )
     await state.set_state(Form.noble)
 
+@form_router.callback_query(F.data == "photo:skip")
+async def cb_photo_skip(cq: CallbackQuery, state: FSMContext):
+    if await state.get_state() != Form.photo.state:
+        await safe_cq_answer(cq)
+        return
+
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
+    form.photo_id = form.photo_uid = form.photo_kind = None
+
+    await edit_text_cached(
+        cq.message,
+        build_step_text(lang, 7, "step7"),
+        k_noble(lang),
+    )
+    await state.set_state(Form.noble)
+
 # ===================== Step 7 Noble =====================
-@dp.callback_query(F.data.startswith("noble:"))
+@form_router.callback_query(F.data.startswith("noble:"))
 async def cb_noble(cq: CallbackQuery, state: FSMContext):
     if await state.get_state() != Form.noble.state:
         await safe_cq_answer(cq)
         return
 
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-    t = TXT[lang]
-
-    val = cq.data.split(":", 1)[1]
-    if val == "yes":
-        noble = t["noble_yes"].replace("✅ ", "")
-    elif val == "no":
-        noble = t["noble_no"].replace("❌ ", "")
-    else:
-        noble = t["noble_progress"].replace("⏳ ", "")
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.update_data(noble=noble)
+    form.noble = choice_code(NOBLE_CHOICES, cq.data.split(":", 1)[1])
 
-    await cq.message.edit_text(
+    await edit_text_cached(
+        cq.message,
         build_step_text(lang, 8, "step8"),
-        reply_markup=k_cancel_back(lang, with_back=True),
-        parse_mode="HTML",
+        k_cancel_back(lang, with_back=True),
     )
     await state.set_state(Form.prime)
-    await safe_cq_answer(cq)
 
 # ===================== Step 8 Prime =====================
-@dp.message(Form.prime)
+@form_router.message(Form.prime)
 async def step_prime(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     if bad_text_general(m.text):
         await m.answer(TXT[lang]["step8_bad"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(prime=m.text.strip()[:80])
+    form.prime = m.text.strip()[:80]
 
     await m.answer(
         build_step_text(lang, 9, "step9"),
@@ -1035,73 +1754,57 @@ async def step_prime(m: Message, state: FSMContext):
     await state.set_state(Form.mic)
 
 # ===================== Step 9 Mic =====================
-@dp.callback_query(F.data.startswith("mic:"))
+@form_router.callback_query(F.data.startswith("mic:"))
 async def cb_mic(cq: CallbackQuery, state: FSMContext):
     if await state.get_state() != Form.mic.state:
         await safe_cq_answer(cq)
         return
 
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-    t = TXT[lang]
-
-    val = cq.data.split(":", 1)[1]
-    mic = t["mic_yes"].replace("🎙 ", "") if val == "yes" else t["mic_no"].replace("❌ ", "")
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.update_data(mic=mic)
+    form.mic = choice_code(MIC_CHOICES, cq.data.split(":", 1)[1])
 
-    await cq.message.edit_text(
+    await edit_text_cached(
+        cq.message,
         build_step_text(lang, 10, "step10"),
-        reply_markup=k_ready(lang),
-        parse_mode="HTML",
+        k_ready(lang),
     )
     await state.set_state(Form.ready)
-    await safe_cq_answer(cq)
 
 # ===================== Step 10 Ready =====================
-@dp.callback_query(F.data.startswith("ready:"))
+@form_router.callback_query(F.data.startswith("ready:"))
 async def cb_ready(cq: CallbackQuery, state: FSMContext):
     if await state.get_state() != Form.ready.state:
         await safe_cq_answer(cq)
         return
 
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-    t = TXT[lang]
-
-    val = cq.data.split(":", 1)[1]
-    if val == "yes":
-        ready = t["ready_yes"].replace("✅ ", "")
-    elif val == "sometimes":
-        ready = t["ready_sometimes"].replace("⚠️ ", "")
-    else:
-        ready = t["ready_no"].replace("❌ ", "")
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.update_data(ready=ready)
+    form.ready = choice_code(READY_CHOICES, cq.data.split(":", 1)[1])
 
-    await cq.message.edit_text(
+    await edit_text_cached(
+        cq.message,
         build_step_text(lang, 11, "step11"),
-        reply_markup=k_cancel_back(lang, with_back=True),
-        parse_mode="HTML",
+        k_cancel_back(lang, with_back=True),
     )
     await state.set_state(Form.why)
-    await safe_cq_answer(cq)
 
 # ===================== Step 11 Why =====================
-@dp.message(Form.why)
+@form_router.message(Form.why)
 async def step_why(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     t = (m.text or "").strip()
     if not t or bad_text_general(t):
         await m.answer(TXT[lang]["step11_bad"], reply_markup=k_cancel_back(lang, with_back=True), parse_mode="HTML")
         return
 
-    await state.update_data(why=t[:180])
+    form.why = t[:180]
 
     await m.answer(
         build_step_text(lang, 12, "step12"),
@@ -1111,84 +1814,1333 @@ async def step_why(m: Message, state: FSMContext):
     await state.set_state(Form.discipline)
 
 # ===================== Step 12 Discipline =====================
-@dp.callback_query(F.data.startswith("disc:"))
+@form_router.callback_query(F.data.startswith("disc:"))
 async def cb_disc(cq: CallbackQuery, state: FSMContext):
     if await state.get_state() != Form.discipline.state:
         await safe_cq_answer(cq)
         return
 
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-
-    val = cq.data.split(":", 1)[1]
-    ok = (val == "yes")
-
-    if lang == "ru":
-        disc_text = "подтверждена" if ok else "не подтверждена"
-    elif lang == "ua":
-        disc_text = "підтверджено" if ok else "не підтверджено"
-    else:
-        disc_text = "confirmed" if ok else "not confirmed"
+    await safe_cq_answer(cq)
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
-    await state.update_data(discipline=disc_text, discipline_ok=ok)
+    form.discipline = cq.data.split(":", 1)[1] == "yes"
 
-    if not ok:
-        await send_admin_application_ru(cq.from_user, await state.get_data(), discipline_ok=False)
-        await state.clear()
-        await state.update_data(lang=lang)
-        await cq.message.edit_text(TXT[lang]["disc_decline_user"], reply_markup=k_start(lang), parse_mode="HTML")
-        await safe_cq_answer(cq)
+    if not form.discipline:
+        await reset_form(state, lang)
+        await gather_api_calls(
+            send_admin_application_ru(cq.from_user, form),
+            edit_text_cached(cq.message, TXT[lang]["disc_decline_user"], k_start(lang)),
+        )
         return
 
-    data2 = await state.get_data()
-    await cq.message.edit_text(fmt_preview(lang, data2), reply_markup=k_confirm(lang), parse_mode="HTML")
+    await edit_text_cached(cq.message, fmt_preview(lang, form), k_confirm(lang))
     await state.set_state(Form.confirm)
-    await safe_cq_answer(cq)
 
 # ===================== Confirm send =====================
-@dp.callback_query(F.data == "confirm_send")
+@form_router.callback_query(F.data == "confirm_send")
 async def cb_confirm_send(cq: CallbackQuery, state: FSMContext):
     if await state.get_state() != Form.confirm.state:
         await safe_cq_answer(cq)
         return
 
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
+    form = form_of(state)
+    lang = safe_lang(form.lang)
 
     now = datetime.now(timezone.utc)
-    prev = last_submit.get(cq.from_user.id)
-    if prev and now - prev < timedelta(hours=COOLDOWN_HOURS):
-        await safe_cq_answer(cq, TXT[lang]["cooldown"], show_alert=True)
+    blocked = submit_blocked_text(cq.from_user.id, lang, now)
+    if blocked:
+        await safe_cq_answer(cq, blocked, show_alert=True)
         return
 
-    await send_admin_application_ru(cq.from_user, data, discipline_ok=True)
-
-    last_submit[cq.from_user.id] = now
-    await state.clear()
-    await state.update_data(lang=lang)
-
-    await cq.message.edit_text(TXT[lang]["sent"], reply_markup=k_start(lang), parse_mode="HTML")
     await safe_cq_answer(cq, "OK")
 
-@dp.message(Form.confirm)
+    last_submit.record(cq.from_user.id, now)
+    await reset_form(state, lang)
+
+    admin_res, _ = await gather_api_calls(
+        send_admin_application_ru(cq.from_user, form),
+        edit_text_cached(cq.message, TXT[lang]["sent"], k_start(lang)),
+    )
+    if isinstance(admin_res, Exception):
+        # Заявка до админов не дошла — возвращаем анкету, чтобы можно было отправить ещё раз
+        last_submit.forget(cq.from_user.id)
+        storage.set_form(state.key, form)
+        await state.set_state(Form.confirm)
+        await edit_text_cached(cq.message, fmt_preview(lang, form), k_confirm(lang))
+
+@form_router.message(Form.confirm)
 async def in_confirm_state(m: Message, state: FSMContext):
-    data = await state.get_data()
-    lang = safe_lang(data.get("lang"))
-    if not await guard_private_message(m, lang):
-        return
+    form = form_of(state)
+    lang = safe_lang(form.lang)
     await m.answer(TXT[lang]["confirm_hint"], reply_markup=k_confirm(lang), parse_mode="HTML")
 
+# ===================== Paced sending =====================
+class PacedSender:
+    """
+    Вызовы Bot API не чаще rate в секунду, равномерно, без всплесков.
+    429 от Telegram ставит на паузу весь отправитель на retry_after,
+    сбои сети/5xx повторяются с backoff.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+
+    def pause(self, seconds: float):
+        self._next = max(self._next, time.monotonic() + seconds)
+
+    async def _slot(self):
+        now = time.monotonic()
+        wait = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def call(self, make_call, retries: int = 3):
+        """make_call() -> корутина вызова API (новая на каждую попытку)."""
+        attempt = 0
+        while True:
+            await self._slot()
+            try:
+                return await make_call()
+            except TelegramRetryAfter as e:
+                STATS["paced_retry_after"] += 1
+                self.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError):
+                attempt += 1
+                if attempt > retries:
+                    raise
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+# ===================== Admin routing =====================
+ROUTE_LVL_MAX = 99
+ADMIN_OUTBOX_PATH = os.path.join(DATA_DIR, "admin_outbox.jsonl")
+ADMIN_RETRY_DELAY = 30.0  # сек, если Bot API недоступен и после повторов PacedSender
+
+class AdminRoutes:
+    """
+    Куда слать заявку. Правила через ";", первое подошедшее выигрывает, иначе ADMIN_CHAT_ID:
+
+        ADMIN_ROUTES="lang=ua -> -1001234:7; lvl=80-99 prof=necro,sorc -> -1005678"
+
+    Условия (все необязательные, между собой — И): lang=ru,ua; lvl=80-99 или lvl=80;
+    prof=слово,... — начало любого слова в "Профа/Саб", без учёта регистра.
+    Адрес — chat_id или chat_id:message_thread_id (тема форума).
+
+    При старте правила раскладываются в битовые маски (бит i — правило i): по языку,
+    по каждому LVL и по началу слова. Заявка — три поиска и AND масок, от числа
+    правил не зависит; младший бит результата — первое подошедшее правило.
+    """
+
+    def __init__(self, rules: list[tuple[dict, tuple[int, int | None]]], default: tuple[int, int | None]):
+        self.default = default
+        self.destinations = [dest for _, dest in rules]
+        self.lang_any = 0
+        self.by_lang: dict[str, int] = {}
+        self.by_lvl = [0] * (ROUTE_LVL_MAX + 1)
+        self.prof_any = 0
+        self.by_word: dict[str, int] = {}
+        self.word_max = 0
+        for i, (cond, _) in enumerate(rules):
+            bit = 1 << i
+            if "lang" in cond:
+                for lang in cond["lang"]:
+                    self.by_lang[lang] = self.by_lang.get(lang, 0) | bit
+            else:
+                self.lang_any |= bit
+            lo, hi = cond.get("lvl", (0, ROUTE_LVL_MAX))
+            for lvl in range(lo, hi + 1):
+                self.by_lvl[lvl] |= bit
+            if "prof" in cond:
+                for word in cond["prof"]:
+                    self.by_word[word] = self.by_word.get(word, 0) | bit
+                    self.word_max = max(self.word_max, len(word))
+            else:
+                self.prof_any |= bit
+
+    @classmethod
+    def parse(cls, spec: str, default: tuple[int, int | None]) -> "AdminRoutes":
+        """ValueError на кривое правило."""
+        rules = []
+        for raw in spec.split(";"):
+            if not raw.strip():
+                continue
+            cond_part, arrow, dest_part = raw.partition("->")
+            if not arrow:
+                raise ValueError(f"no '->' in rule: {raw.strip()}")
+            chat, _, thread = dest_part.strip().partition(":")
+            dest = (int(chat), int(thread) if thread else None)
+
+            cond: dict = {}
+            for arg in cond_part.split():
+                key, sep, value = arg.partition("=")
+                values = [v for v in value.split(",") if v]
+                if not sep or not values or key in cond:
+                    raise ValueError(f"bad condition: {arg}")
+                if key == "lang":
+                    unknown = set(values) - set(SUPPORTED_LANGS)
+                    if unknown:
+                        raise ValueError(f"unknown lang: {', '.join(sorted(unknown))}")
+                    cond["lang"] = values
+                elif key == "lvl":
+                    lo, _, hi = value.partition("-")
+                    lo, hi = int(lo), int(hi or lo)
+                    if not 1 <= lo <= hi <= ROUTE_LVL_MAX:
+                        raise ValueError(f"bad lvl range: {value}")
+                    cond["lvl"] = (lo, hi)
+                elif key == "prof":
+                    cond["prof"] = [v.casefold() for v in values]
+                else:
+                    raise ValueError(f"unknown condition: {key}")
+            rules.append((cond, dest))
+        return cls(rules, default)
+
+    def _prof_mask(self, prof: str | None) -> int:
+        mask = self.prof_any
+        if self.by_word and prof:
+            # prof обрезан до 80 символов, на слово — не больше word_max поисков
+            for word in re.findall(r"\w+", prof.casefold()):
+                for n in range(1, min(len(word), self.word_max) + 1):
+                    mask |= self.by_word.get(word[:n], 0)
+        return mask
+
+    def route(self, lang: str, lvl: int | None, prof: str | None) -> tuple[int, int | None]:
+        mask = (
+            (self.lang_any | self.by_lang.get(lang, 0))
+            & self.by_lvl[min(lvl or 0, ROUTE_LVL_MAX)]
+            & self._prof_mask(prof)
+        )
+        if not mask:
+            return self.default
+        return self.destinations[(mask & -mask).bit_length() - 1]
+
+try:
+    admin_routes = AdminRoutes.parse(ADMIN_ROUTES, (ADMIN_CHAT_ID, None))
+except ValueError as e:
+    raise RuntimeError(f"ADMIN_ROUTES: {e}") from None
+
+class AdminOutbox:
+    """
+    Заявки админам — через очередь и свой PacedSender на каждый чат: лимит Telegram
+    считается на чат (темы форума делят лимит своего чата), поэтому чаты не ждут
+    друг друга и пропускная способность растёт с их числом. Обработчик апдейта
+    только кладёт заявку в очередь.
+
+    Очередь — ещё и журнал в файле: заявка дописывается строкой при постановке,
+    после доставки — строка {"done": номер}. После падения (не только штатной
+    остановки) load ставит в очередь всё, что не помечено доставленным. Когда
+    очереди пустеют, журнал удаляется, так что в обычной работе он короткий.
+    """
+
+    def __init__(self, path: str, rate_per_min: float, maxsize: int):
+        self.path = path
+        self.rate = rate_per_min / 60
+        self.maxsize = maxsize
+        self._queues: dict[int, asyncio.Queue] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._current: dict[int, dict] = {}  # chat_id -> заявка, которая сейчас отправляется
+        self._moved: dict[int, int] = {}  # группа стала супергруппой: старый chat_id -> новый
+
+    @property
+    def pending(self) -> int:
+        return sum(q.qsize() for q in self._queues.values()) + len(self._current)
+
+    def check_room(self, chat_id: int):
+        """asyncio.QueueFull, если очередь чата заполнена. До put без await — put не откажет."""
+        queue = self._queues.get(self._moved.get(chat_id, chat_id))
+        if queue is not None and queue.qsize() >= self.maxsize:
+            STATS["admin_queue_full"] += 1
+            raise asyncio.QueueFull
+
+    def put(self, item: dict, force: bool = False):
+        """asyncio.QueueFull, если очередь чата заполнена (force — класть всё равно)."""
+        if not force:
+            self.check_room(item["chat_id"])
+        chat_id = self._moved.get(item["chat_id"])
+        if chat_id is not None:
+            item = {**item, "chat_id": chat_id}
+        else:
+            chat_id = item["chat_id"]
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        self._ensure_worker(chat_id)
+        self._journal(item)
+        queue.put_nowait(item)
+
+    def _journal(self, record: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _ensure_worker(self, chat_id: int):
+        """Запускает воркер чата, если его нет или он упал — иначе очередь стоит до переполнения."""
+        task = self._workers.get(chat_id)
+        if task is not None and not task.done():
+            return
+        if task is not None and not task.cancelled() and task.exception() is not None:
+            log.error("Admin outbox worker for %s died, restarting", chat_id, exc_info=task.exception())
+        queue = self._queues[chat_id]
+        self._workers[chat_id] = asyncio.create_task(self._work(chat_id, queue, PacedSender(self.rate)))
+
+    async def _deliver(self, sender: PacedSender, item: dict):
+        chat_id, thread_id = item["chat_id"], item["thread_id"]
+        if item.get("message_id") is None:
+            sent = await sender.call(partial(
+                bot.send_message,
+                chat_id,
+                item["text"],
+                parse_mode="HTML",
+                message_thread_id=thread_id,
+                reply_markup=k_admin_contact(item["user_id"]),
+            ))
+            # Текст ушёл: после рестарта досылаем только скриншот
+            item["message_id"] = sent.message_id
+            STATS["admin_sent"] += 1
+            if item["photo_id"]:
+                self._journal(item)
+
+        if item["photo_id"]:
+            # Пересылаем по file_id: байты остаются у Telegram, через наш сервер не идут
+            send_media = bot.send_document if item["photo_kind"] == "document" else bot.send_photo
+            try:
+                await sender.call(partial(
+                    send_media,
+                    chat_id,
+                    item["photo_id"],
+                    caption=f"📸 Скриншот к заявке №{item['app_no']}",
+                    message_thread_id=thread_id,
+                    reply_to_message_id=item["message_id"],
+                ))
+            except TelegramBadRequest as e:
+                # Заявка уже у админов — из-за картинки её не переотправляем
+                log.warning("Screenshot for application %s not delivered: %s", item["app_no"], e)
+
+    async def _work(self, chat_id: int, queue: asyncio.Queue, sender: PacedSender):
+        while True:
+            item = await queue.get()
+            self._current[chat_id] = item
+            # False — заявка ушла в другую очередь и там записана в журнал заново
+            finished = True
+            try:
+                while True:
+                    try:
+                        await self._deliver(sender, item)
+                        break
+                    except (TelegramNetworkError, TelegramServerError) as e:
+                        log.warning("Admin chat %s unavailable, retrying in %.0fs: %s", chat_id, ADMIN_RETRY_DELAY, e)
+                        await asyncio.sleep(ADMIN_RETRY_DELAY)
+                    except TelegramMigrateToChat as e:
+                        # Группу обновили до супергруппы: эта и следующие заявки идут по новому chat_id.
+                        # Старая группа закрыта — отправленный туда текст админы не увидят, шлём целиком
+                        log.warning("Admin chat %s migrated to %s, application %s follows it",
+                                    chat_id, e.migrate_to_chat_id, item["app_no"])
+                        self._moved[chat_id] = e.migrate_to_chat_id
+                        self.put({**item, "chat_id": e.migrate_to_chat_id, "message_id": None}, force=True)
+                        finished = False
+                        break
+                    except (TelegramBadRequest, TelegramForbiddenError) as e:
+                        default_chat, default_thread = admin_routes.default
+                        default = (self._moved.get(default_chat, default_chat), default_thread)
+                        if (chat_id, item["thread_id"]) == default or item.get("message_id") is not None:
+                            STATS["admin_failed"] += 1
+                            log.error("Application %s not delivered to %s: %s", item["app_no"], chat_id, e)
+                        else:
+                            # Чат или тема из правил недоступны — заявка уходит в основной админ-чат
+                            log.warning("Route %s:%s failed (%s), application %s goes to ADMIN_CHAT_ID",
+                                        chat_id, item["thread_id"], e, item["app_no"])
+                            chat, thread = admin_routes.default
+                            self.put({**item, "chat_id": chat, "thread_id": thread}, force=True)
+                            finished = False
+                        break
+                    except Exception:
+                        # Не сетевой и не 4xx (404, 401, ошибка в коде): заявку не повторяем,
+                        # но воркер живёт — иначе очередь чата встанет насовсем
+                        STATS["admin_failed"] += 1
+                        log.exception("Application %s not delivered to %s", item["app_no"], chat_id)
+                        break
+                if finished:
+                    self._journal({"done": item["app_no"]})
+            finally:
+                del self._current[chat_id]
+                queue.task_done()
+            if not self.pending:
+                with suppress(FileNotFoundError):
+                    os.remove(self.path)
+
+    async def flush(self, timeout: float) -> bool:
+        """Ждёт, пока все очереди опустеют."""
+        for chat_id in self._queues:
+            self._ensure_worker(chat_id)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues.values())), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self) -> int:
+        """Останавливает отправку, журнал сжимается до неотправленного (и прерванного). Возвращает их число."""
+        left = list(self._current.values())
+        for task in self._workers.values():
+            task.cancel()
+        for task in self._workers.values():
+            with suppress(asyncio.CancelledError):
+                await task
+        for queue in self._queues.values():
+            while not queue.empty():
+                left.append(queue.get_nowait())
+        self._queues.clear()
+        self._workers.clear()
+
+        if left:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for item in left:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+        else:
+            with suppress(FileNotFoundError):
+                os.remove(self.path)
+        return len(left)
+
+    def load(self) -> int:
+        """
+        Ставит в очередь недоставленное из журнала — после штатной остановки или падения.
+        Последняя запись заявки главнее (переадресация, уже отправленный текст).
+        """
+        if not os.path.exists(self.path):
+            return 0
+        items: dict[int, dict] = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Строка, оборванная падением посреди записи
+                    log.warning("Skipping torn line in %s", self.path)
+                    continue
+                if "done" in record:
+                    items.pop(record["done"], None)
+                else:
+                    items[record["app_no"]] = record
+        os.remove(self.path)
+        for item in items.values():
+            self.put(item, force=True)
+        return len(items)
+
+admin_outbox = AdminOutbox(ADMIN_OUTBOX_PATH, ADMIN_RATE_PER_MIN, ADMIN_QUEUE_MAX)
+
+# ===================== Reminders =====================
+REMINDERS_PATH = os.path.join(DATA_DIR, "reminders.bin")
+REMINDERS_MAGIC = b"RBR1"
+_REM_HEAD = struct.Struct("<4sI")  # magic, таймеров
+_REM_ENTRY = struct.Struct("<qqqd")  # bot_id, chat_id, user_id, сколько секунд осталось
+# Шаги, на которых напоминаем; на приветствии (Form.lang) анкету ещё не начинали
+REMIND_STATES = frozenset(FORM_INDEX) | {Form.confirm.state}
+
+class ReminderScheduler:
+    """
+    Напоминание тем, кто delay секунд не двигается по анкете. Таймеры — куча по сроку,
+    постановка O(log n). Отмена ленивая: у ключа номер живого таймера, каждый set_state
+    заводит новый, а устаревшие записи кучи отбрасываются при выемке (и при пересборке,
+    когда мусора набирается больше, чем живых). Напоминание одно на заход на шаг.
+    """
+
+    def __init__(self, delay: float, sender: PacedSender):
+        self.delay = delay
+        self.sender = sender
+        self._heap: list[tuple[float, int, StorageKey]] = []  # (срок, номер, ключ)
+        self._live: dict[StorageKey, int] = {}  # ключ -> номер живого таймера
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._live)
+
+    def _push(self, key: StorageKey, due: float):
+        self._seq += 1
+        self._live[key] = self._seq
+        heapq.heappush(self._heap, (due, self._seq, key))
+        if len(self._heap) > 2 * len(self._live) + 1024:
+            self._heap = [e for e in self._heap if self._live.get(e[2]) == e[1]]
+            heapq.heapify(self._heap)
+        if self._heap[0][1] == self._seq:
+            self._wake.set()
+
+    def on_state(self, key: StorageKey, state: str | None):
+        """Хук BoundedMemoryStorage: новый шаг — таймер заново, вне анкеты — отмена."""
+        if self.delay and state in REMIND_STATES:
+            self._push(key, time.monotonic() + self.delay)
+        else:
+            self._live.pop(key, None)
+
+    def _pop_due(self) -> tuple[StorageKey | None, float | None]:
+        """(ключ, 0) — кому пора напомнить; иначе (None, сколько ждать), без таймеров — (None, None)."""
+        while self._heap:
+            due, seq, key = self._heap[0]
+            if self._live.get(key) != seq:
+                heapq.heappop(self._heap)
+                continue
+            wait = due - time.monotonic()
+            if wait > 0:
+                return None, wait
+            heapq.heappop(self._heap)
+            del self._live[key]
+            return key, 0.0
+        return None, None
+
+    async def _send(self, key: StorageKey, state: str):
+        record = storage.peek(key)
+        # Пока ждали слота, пользователь мог пойти дальше или бросить анкету
+        if record is None or record.state != state:
+            return
+        lang = safe_lang(record.form.lang if record.form else None)
+        if state == Form.confirm.state:
+            text = TXT[lang]["reminder_confirm"]
+        else:
+            text = TXT[lang]["reminder"].format(step=STATE_TO_STEP[state], total=TOTAL_STEPS)
+        await bot.send_message(key.chat_id, text, parse_mode="HTML")
+        STATS["reminders_sent"] += 1
+
+    async def _run(self):
+        while True:
+            key, wait = self._pop_due()
+            if key is None:
+                self._wake.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                continue
+            record = storage.peek(key)
+            if record is None:
+                continue
+            while admission.inflight >= BACKGROUND_BUSY_INFLIGHT:
+                await asyncio.sleep(1.0)
+            try:
+                await self.sender.call(partial(self._send, key, record.state))
+            except (TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError, TelegramServerError) as e:
+                STATS["reminders_failed"] += 1
+                log.info("Reminder to %s not delivered: %s", key.chat_id, e)
+            except Exception:
+                # Любая другая ошибка — только про это напоминание, остальные должны уйти
+                STATS["reminders_failed"] += 1
+                log.exception("Reminder to %s failed", key.chat_id)
+
+    def start(self):
+        if self._task is None and self.delay:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def save(self, path: str) -> int:
+        now = time.monotonic()
+        entries = [(key, due - now) for due, seq, key in self._heap if self._live.get(key) == seq]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_REM_HEAD.pack(REMINDERS_MAGIC, len(entries)))
+            for key, left in entries:
+                f.write(_REM_ENTRY.pack(key.bot_id, key.chat_id, key.user_id, left))
+        os.replace(tmp, path)
+        return len(entries)
+
+    def load(self, path: str) -> int:
+        """
+        После load_snapshot: восстановленные сессии уже завели таймеры с полным сроком,
+        заменяем их сохранёнными — с остатком срока и без уже отправленных напоминаний.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            raw = f.read()
+        os.remove(path)
+        magic, count = _REM_HEAD.unpack_from(raw)
+        if magic != REMINDERS_MAGIC:
+            log.warning("Reminders file %s has unknown format, ignored", path)
+            return 0
+        self._heap.clear()
+        self._live.clear()
+        now = time.monotonic()
+        restored = 0
+        for i in range(count):
+            bot_id, chat_id, user_id, left = _REM_ENTRY.unpack_from(raw, _REM_HEAD.size + _REM_ENTRY.size * i)
+            key = StorageKey(bot_id=bot_id, chat_id=chat_id, user_id=user_id)
+            if storage.peek(key) is not None:
+                self._push(key, now + left)
+                restored += 1
+        return restored
+
+reminders = ReminderScheduler(REMINDER_AFTER_MINUTES * 60, PacedSender(REMINDER_RATE))
+storage.on_state = reminders.on_state
+
+# ===================== Broadcast =====================
+BROADCAST_PATH = os.path.join(DATA_DIR, "broadcast.json")
+BROADCAST_CHECKPOINT_EVERY = 25  # при падении (не штатной остановке) повторно уйдёт не больше стольких
+BROADCAST_PROGRESS_EVERY = 5.0  # сек между обновлениями статуса в админ-чате
+
+def broadcast_recipients(limit: int | None = None) -> list[int]:
+    """Все, кто подавал заявку, по порядку первой заявки. Лог только дописывается, поэтому порядок стабилен."""
+    seen: set[int] = set()
+    out: list[int] = []
+    for record in applications.iter():
+        user_id = record.get("user_id")
+        if user_id and user_id not in seen:
+            seen.add(user_id)
+            out.append(user_id)
+            if limit is not None and len(out) >= limit:
+                break
+    return out
+
+def fmt_duration(seconds: float) -> str:
+    minutes, sec = divmod(int(seconds), 60)
+    return f"{minutes // 60} ч {minutes % 60} мин" if minutes >= 60 else f"{minutes} мин {sec} с"
+
+class Broadcast:
+    """
+    Рассылка всем, кто подавал заявку, в фоне через PacedSender.
+    Состояние (сколько пройдено и с каким итогом) — в checkpoint-файле:
+    после рестарта рассылка продолжается с того же места.
+    """
+
+    def __init__(self, path: str, sender: PacedSender):
+        self.path = path
+        self.sender = sender
+        self.state: dict | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def start(self, state: dict):
+        self.state = state
+        self._save()
+        self._task = asyncio.create_task(self._run())
+
+    def resume(self):
+        if self.state and self.state["status"] == "running" and not self.running:
+            log.info("Resuming broadcast #%s at %d/%d", self.state["id"], self.state["done"], self.state["total"])
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Штатная остановка: checkpoint сохраняется, после рестарта продолжим."""
+        if self.running:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def cancel(self):
+        self.state["status"] = "cancelled"
+        await self.stop()
+        self._save()
+
+    def progress_text(self, rate: float | None = None) -> str:
+        st = self.state
+        text = (
+            f"📣 Рассылка №{st['id']}: <b>{st['done']}/{st['total']}</b>\n"
+            f"доставлено {st['sent']}, заблокировали бота {st['blocked']}, ошибок {st['failed']}"
+        )
+        if st["status"] == "running":
+            left = st["total"] - st["done"]
+            if rate:
+                text += f"\nосталось ~{fmt_duration(left / rate)}"
+        else:
+            text += {"done": "\n✅ Завершена", "cancelled": "\n⛔ Отменена"}.get(st["status"], "")
+        return text
+
+    async def _report(self, rate: float | None = None):
+        st = self.state
+        try:
+            await self.sender.call(lambda: bot.edit_message_text(
+                self.progress_text(rate),
+                chat_id=ADMIN_CHAT_ID,
+                message_id=st["status_message_id"],
+                parse_mode="HTML",
+            ))
+        except (TelegramBadRequest, TelegramNetworkError, TelegramServerError):
+            pass
+        except Exception:
+            log.exception("Broadcast #%s progress not updated", st["id"])
+
+    async def _deliver(self, user_id: int):
+        st = self.state
+        if st.get("from_message_id"):
+            await bot.copy_message(user_id, ADMIN_CHAT_ID, st["from_message_id"])
+        else:
+            await bot.send_message(user_id, st["text"])
+
+    async def _run(self):
+        st = self.state
+        recipients = await asyncio.to_thread(broadcast_recipients, st["total"])
+        started, done_at_start = time.monotonic(), st["done"]
+        reported = started
+        try:
+            for user_id in recipients[st["done"]:]:
+                while admission.inflight >= BACKGROUND_BUSY_INFLIGHT:
+                    await asyncio.sleep(1.0)
+                try:
+                    await self.sender.call(partial(self._deliver, user_id))
+                    st["sent"] += 1
+                except TelegramForbiddenError:
+                    # Бот заблокирован или аккаунт удалён
+                    st["blocked"] += 1
+                except (TelegramBadRequest, TelegramNetworkError, TelegramServerError):
+                    st["failed"] += 1
+                except Exception:
+                    # Ошибка про одного получателя не должна обрывать рассылку остальным
+                    st["failed"] += 1
+                    log.exception("Broadcast #%s to %s failed", st["id"], user_id)
+                st["done"] += 1
+                if st["done"] % BROADCAST_CHECKPOINT_EVERY == 0:
+                    self._save()
+                now = time.monotonic()
+                if now - reported >= BROADCAST_PROGRESS_EVERY:
+                    reported = now
+                    await self._report((st["done"] - done_at_start) / (now - started))
+            st["status"] = "done"
+        finally:
+            self._save()
+        await self._report()
+
+broadcast = Broadcast(BROADCAST_PATH, PacedSender(BROADCAST_RATE))
+
+# ===================== Admin chat =====================
+admin_router = Router(name="admin")
+admin_router.message.filter(F.chat.id == ADMIN_CHAT_ID)
+
+EXPORT_USAGE = (
+    "Использование: <code>/export [csv|jsonl] [from=YYYY-MM-DD] [to=YYYY-MM-DD] "
+    f"[lang={'|'.join(SUPPORTED_LANGS)}] [lvl=70-99]</code>"
+)
+
+@admin_router.message(Command("export"))
+async def cmd_export(m: Message, command: CommandObject):
+    fmt = "csv"
+    params: dict[str, str] = {}
+    for arg in (command.args or "").split():
+        key, sep, value = arg.partition("=")
+        if not sep and key in ("csv", "jsonl"):
+            fmt = key
+        elif sep and key in ("from", "to", "lang", "lvl"):
+            params[key] = value
+        else:
+            await m.answer(EXPORT_USAGE, parse_mode="HTML")
+            return
+
+    try:
+        accept = export_filter(params.get("from"), params.get("to"), params.get("lang"), params.get("lvl"))
+    except ValueError:
+        await m.answer(EXPORT_USAGE, parse_mode="HTML")
+        return
+
+    # Выгрузка и отправка файла — в фоне: хэндлер сразу отпускает слот и лок полосы,
+    # иначе заявители из той же полосы ждали бы, пока файл пишется и уходит
+    task = asyncio.create_task(send_export(m, fmt, accept))
+    export_tasks.add(task)
+    task.add_done_callback(export_tasks.discard)
+
+export_tasks: set[asyncio.Task] = set()
+
+async def send_export(m: Message, fmt: str, accept):
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        # Пишем на диск в отдельном потоке, отправляем файлом — ни память, ни event loop не страдают
+        rows = await asyncio.to_thread(write_export, path, fmt, accept)
+        stamp = datetime.now(ADMIN_TZ).strftime("%Y%m%d-%H%M")
+        await m.answer_document(
+            FSInputFile(path, filename=f"applications-{stamp}.{fmt}"),
+            caption=f"Заявок: {rows}",
+        )
+    except Exception:
+        log.exception("Export to %s failed", m.chat.id)
+    finally:
+        os.unlink(path)
+
+BROADCAST_USAGE = (
+    "Использование: <code>/broadcast текст</code> или ответом <code>/broadcast</code> "
+    "на сообщение, которое надо разослать (копируется как есть, с медиа и разметкой).\n"
+    "<code>/broadcast_status</code>, <code>/broadcast_cancel</code>"
+)
+
+@admin_router.message(Command("broadcast"))
+async def cmd_broadcast(m: Message, command: CommandObject):
+    if broadcast.running:
+        await m.answer(broadcast.progress_text() + "\n\nУже идёт — дождитесь или /broadcast_cancel", parse_mode="HTML")
+        return
+    reply = m.reply_to_message
+    text = (command.args or "").strip()
+    if not text and not reply:
+        await m.answer(BROADCAST_USAGE, parse_mode="HTML")
+        return
+
+    total = len(await asyncio.to_thread(broadcast_recipients))
+    if not total:
+        await m.answer("Заявок ещё нет — рассылать некому.")
+        return
+    status = await m.answer(f"📣 Рассылка: получателей {total}, начинаю…")
+    broadcast.start({
+        "id": m.message_id,
+        "text": None if reply else text,
+        "from_message_id": reply.message_id if reply else None,
+        "total": total,
+        "done": 0,
+        "sent": 0,
+        "blocked": 0,
+        "failed": 0,
+        "status": "running",
+        "status_message_id": status.message_id,
+    })
+
+@admin_router.message(Command("broadcast_status"))
+async def cmd_broadcast_status(m: Message):
+    if broadcast.state is None:
+        await m.answer("Рассылок ещё не было.")
+        return
+    await m.answer(broadcast.progress_text(), parse_mode="HTML")
+
+@admin_router.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(m: Message):
+    if not broadcast.running:
+        await m.answer("Сейчас рассылка не идёт.")
+        return
+    await broadcast.cancel()
+    await m.answer(broadcast.progress_text(), parse_mode="HTML")
+
+dp.include_routers(form_router, admin_router)
+
+# ===================== Health =====================
+LAG_SAMPLE_INTERVAL = 0.5
+LAG_WINDOW = 60  # замеров, т.е. последние ~30 секунд
+READY_MAX_LAG = 1.0  # худший лаг за окно, при котором ещё принимаем трафик
+LIVE_MAX_STALL = 10.0  # столько секунд без тика пульса — инстанс считаем зависшим
+READY_MAX_STORAGE_RTT = 0.5
+READY_MAX_API_ERROR_RATE = 0.5
+API_ERROR_MIN_CALLS = 10  # на меньшем числе вызовов долю ошибок не оцениваем
+
+class LoopLagMonitor:
+    """
+    Фоновая задача засыпает на interval и меряет, насколько позже проснулась, —
+    это задержка event loop. Отдельная задача-пульс тикает каждые slow_after/4,
+    поток-сторож следит за её последним тиком: если loop занят дольше slow_after,
+    пишет в лог стек главного потока, т.е. тот хэндлер, который сейчас держит loop.
+    """
+
+    def __init__(self, interval: float, window: int, slow_after: float):
+        self.interval = interval
+        self.slow_after = slow_after
+        # Пульс намного чаще порога: блокировку посреди интервала сэмплера тоже видно
+        self.beat = slow_after / 4
+        self.samples: deque[float] = deque(maxlen=window)
+        self.last_beat = time.monotonic()
+        self.stalls = 0
+        self._tasks: list[asyncio.Task] = []
+        self._stop = threading.Event()
+        self._watchdog: threading.Thread | None = None
+        self._loop_thread = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not any(task.done() for task in self._tasks)
+
+    @property
+    def lag(self) -> float:
+        return self.samples[-1] if self.samples else 0.0
+
+    @property
+    def lag_max(self) -> float:
+        return max(self.samples, default=0.0)
+
+    def stalled_for(self, now: float | None = None) -> float:
+        """Сколько пульс опаздывает с тиком прямо сейчас — не меньше, чем loop уже занят."""
+        now = time.monotonic() if now is None else now
+        return max(now - self.last_beat - self.beat, 0.0)
+
+    async def _sample_forever(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.monotonic() - started - self.interval, 0.0))
+
+    async def _beat_forever(self):
+        while True:
+            await asyncio.sleep(self.beat)
+            self.last_beat = time.monotonic()
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.beat / 2):
+            beat = self.last_beat
+            stalled = self.stalled_for()
+            if stalled < self.slow_after or beat == reported:
+                continue
+            # Один отчёт на одну остановку loop
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else "?"
+            log.warning("Event loop blocked for %.0f ms, loop thread stack:\n%s", stalled * 1000, stack)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._tasks = [asyncio.create_task(self._sample_forever()), asyncio.create_task(self._beat_forever())]
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+class ApiErrorRate(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: сколько вызовов Bot API было и сколько упало
+    (сеть, 5xx, 429) за последние window секунд. Окно — кольцо корзин по bucket секунд.
+    Ответы 4xx вроде "message is not modified" ошибкой инстанса не считаются.
+    """
+
+    def __init__(self, window: float = 60.0, bucket: float = 5.0):
+        self.bucket = bucket
+        size = int(window // bucket)
+        self._slots = [-1] * size
+        self._calls = [0] * size
+        self._errors = [0] * size
+
+    def _record(self, failed: bool):
+        slot = int(time.monotonic() // self.bucket)
+        i = slot % len(self._slots)
+        if self._slots[i] != slot:
+            self._slots[i] = slot
+            self._calls[i] = self._errors[i] = 0
+        self._calls[i] += 1
+        self._errors[i] += failed
+
+    def totals(self) -> tuple[int, int]:
+        oldest = int(time.monotonic() // self.bucket) - len(self._slots)
+        calls = errors = 0
+        for slot, c, e in zip(self._slots, self._calls, self._errors):
+            if slot > oldest:
+                calls += c
+                errors += e
+        return calls, errors
+
+    async def __call__(self, make_request, bot: Bot, method):
+        failed = False
+        try:
+            return await make_request(bot, method)
+        except (TelegramNetworkError, TelegramServerError, TelegramRetryAfter):
+            failed = True
+            raise
+        finally:
+            self._record(failed)
+
+lag_monitor = LoopLagMonitor(LAG_SAMPLE_INTERVAL, LAG_WINDOW, SLOW_CALLBACK_MS / 1000)
+api_errors = ApiErrorRate()
+bot.session.middleware(api_errors)
+# Ключ, которого нет ни у одного пользователя: чтение по нему — чистый round-trip хранилища
+HEALTH_PROBE_KEY = StorageKey(bot_id=bot.id, chat_id=0, user_id=0)
+
+async def storage_rtt() -> float:
+    started = time.perf_counter()
+    await storage.get_state(HEALTH_PROBE_KEY)
+    return time.perf_counter() - started
+
+# ===================== Shutdown =====================
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "state.bin")
+SNAPSHOT_MAGIC = b"RBS2"
+_SNAP_HEAD = struct.Struct("<4sII")  # magic, сессий, записей кулдауна
+_SNAP_SESSION = struct.Struct("<qqqdHH")  # bot_id, chat_id, user_id, осталось жить, длины состояния и анкеты
+_SNAP_COOLDOWN = struct.Struct("<qd")  # user_id, время заявки (unix)
+
+class Drain:
+    """
+    Остановка без потерь: после begin() новые апдейты не принимаются
+    (вебхук отвечает 503 — Telegram пришлёт их заново), wait() ждёт начатые.
+    """
+
+    def __init__(self):
+        self.active = False
+
+    def begin(self):
+        self.active = True
+
+    async def wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while admission.inflight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+drain = Drain()
+
+def install_drain_signals():
+    """
+    uvicorn ставит свои обработчики SIGTERM/SIGINT до lifespan — встаём перед ними:
+    сразу перестаём принимать апдейты, дальше останавливается сам uvicorn.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def on_signal(signum, frame, previous=previous):
+            drain.begin()
+            previous(signum, frame)
+
+        signal.signal(sig, on_signal)
+
+def save_snapshot(path: str) -> tuple[int, int]:
+    """Недозаполненные анкеты и кулдауны — в файл, чтобы пережить рестарт."""
+    sessions = bytearray()
+    n_sessions = 0
+    for key, state, form, ttl_left in storage.records():
+        if ttl_left <= 0 or key.thread_id is not None or key.business_connection_id is not None:
+            continue
+        state_raw = (state or "").encode("utf-8")
+        form_raw = form.pack() if form is not None else b""
+        sessions += _SNAP_SESSION.pack(key.bot_id, key.chat_id, key.user_id, ttl_left, len(state_raw), len(form_raw))
+        sessions += state_raw + form_raw
+        n_sessions += 1
+
+    cooldowns = [(user_id, ts.timestamp()) for user_id, ts in last_submit.items()]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_SNAP_HEAD.pack(SNAPSHOT_MAGIC, n_sessions, len(cooldowns)))
+        f.write(sessions)
+        for user_id, ts in cooldowns:
+            f.write(_SNAP_COOLDOWN.pack(user_id, ts))
+    os.replace(tmp, path)
+    return n_sessions, len(cooldowns)
+
+def load_snapshot(path: str) -> tuple[int, int]:
+    """Поднимает снимок и удаляет его: после падения старый снимок не должен всплыть снова."""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path, "rb") as f:
+        raw = f.read()
+    os.remove(path)
+    magic, n_sessions, n_cooldowns = _SNAP_HEAD.unpack_from(raw)
+    if magic != SNAPSHOT_MAGIC:
+        log.warning("Snapshot %s has unknown format, ignored", path)
+        return 0, 0
+
+    pos = _SNAP_HEAD.size
+    for _ in range(n_sessions):
+        bot_id, chat_id, user_id, ttl_left, state_len, form_len = _SNAP_SESSION.unpack_from(raw, pos)
+        pos += _SNAP_SESSION.size
+        state = raw[pos:pos + state_len].decode("utf-8") or None
+        pos += state_len
+        form = Application.unpack(raw[pos:pos + form_len]) if form_len else None
+        pos += form_len
+        key = StorageKey(bot_id=bot_id, chat_id=chat_id, user_id=user_id)
+        storage.restore(key, state, form, ttl_left)
+    for _ in range(n_cooldowns):
+        user_id, ts = _SNAP_COOLDOWN.unpack_from(raw, pos)
+        pos += _SNAP_COOLDOWN.size
+        last_submit.record(user_id, datetime.fromtimestamp(ts, timezone.utc))
+    return n_sessions, n_cooldowns
+
 # ===================== Webhook =====================
+WEBHOOK_SECRET_MARK = os.path.join(DATA_DIR, "webhook.secret.sha256")
+
+def secret_fingerprint() -> str:
+    return hashlib.sha256(WEBHOOK_SECRET.encode()).hexdigest()
+
+async def ensure_webhook() -> bool:
+    """
+    set_webhook вызываем только если текущие настройки у Telegram отличаются.
+    Секрет getWebhookInfo не возвращает — поэтому помним отпечаток последнего
+    установленного в DATA_DIR. Возвращает True, если вебхук был (пере)установлен.
+    """
+    info = await bot.get_webhook_info()
+    try:
+        with open(WEBHOOK_SECRET_MARK, encoding="utf-8") as f:
+            secret_applied = f.read().strip() == secret_fingerprint()
+    except FileNotFoundError:
+        secret_applied = False
+    if (
+        secret_applied
+        and info.url == WEBHOOK_URL
+        and info.max_connections == WEBHOOK_MAX_CONNECTIONS
+        and sorted(info.allowed_updates or []) == sorted(ALLOWED_UPDATES)
+    ):
+        return False
+
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        allowed_updates=ALLOWED_UPDATES,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=DROP_PENDING_UPDATES,
+        secret_token=WEBHOOK_SECRET,
+    )
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(WEBHOOK_SECRET_MARK, "w", encoding="utf-8") as f:
+        f.write(secret_fingerprint())
+    return True
+
+def webhook_reject_status(req: Request) -> int | None:
+    """
+    Проверки по заголовкам, до чтения и разбора тела: чужой секрет, не JSON, слишком большое тело.
+    Возвращает HTTP-статус отказа или None, если запрос можно читать.
+    """
+    secret = req.headers.get("x-telegram-bot-api-secret-token", "")
+    # compare_digest — время сравнения не зависит от того, сколько символов совпало
+    if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+        STATS["webhook_rejected_secret"] += 1
+        return 403
+    if req.headers.get("content-type", "").split(";", 1)[0].strip().lower() != "application/json":
+        STATS["webhook_rejected_type"] += 1
+        return 415
+    length = req.headers.get("content-length", "")
+    if not length.isdigit() or int(length) > WEBHOOK_MAX_BODY:
+        STATS["webhook_rejected_size"] += 1
+        return 413
+    return None
+
 @dp.startup()
 async def startup():
+    dup_index.load()
+    sessions, cooldowns = load_snapshot(SNAPSHOT_PATH)
+    if sessions or cooldowns:
+        log.info("Restored %d sessions and %d cooldowns from snapshot", sessions, cooldowns)
+    timers = reminders.load(REMINDERS_PATH)
+    if timers:
+        log.info("Restored %d reminder timers", timers)
+    reminders.start()
+    storage.start()
+    lag_monitor.start()
+    queued = admin_outbox.load()
+    if queued:
+        log.info("Re-queued %d applications for admins", queued)
+    broadcast.load()
+    broadcast.resume()
     if WEBHOOK_URL:
-        await bot.set_webhook(WEBHOOK_URL)
+        await ensure_webhook()
+
+@dp.shutdown()
+async def shutdown():
+    # Новые апдейты уже не берём; ждём начатые и только потом сохраняем состояние
+    drain.begin()
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    if not await drain.wait(DRAIN_TIMEOUT):
+        log.warning("Shutdown: %d updates still in flight after %.0fs", admission.inflight, DRAIN_TIMEOUT)
+    await admin_outbox.flush(max(deadline - time.monotonic(), 0.0))
+    left = await admin_outbox.close()
+    if left:
+        log.warning("Shutdown: %d applications for admins saved to %s", left, ADMIN_OUTBOX_PATH)
+    await reminders.close()
+    sessions, cooldowns = save_snapshot(SNAPSHOT_PATH)
+    timers = reminders.save(REMINDERS_PATH)
+    log.info("Saved %d sessions, %d cooldowns and %d reminder timers", sessions, cooldowns, timers)
+    await broadcast.stop()
+    await lag_monitor.close()
+    await storage.close()
+    dup_index.close()
+    await bot.session.close()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # uvicorn main:app не запускает жизненный цикл aiogram сам — делаем это здесь
+    await dp.emit_startup(bot=bot)
+    install_drain_signals()
+    # Без PUBLIC_URL вебхука нет — получаем апдейты polling'ом в фоне
+    if not WEBHOOK_URL:
+        poller.start()
+    try:
+        yield
+    finally:
+        drain.begin()
+        await poller.stop()
+        await dp.emit_shutdown(bot=bot)
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post(WEBHOOK_PATH)
 async def webhook(req: Request):
-    await dp.feed_webhook_update(bot, await req.json())
+    received_at = time.monotonic()
+    status = webhook_reject_status(req)
+    if status is not None:
+        return Response(status_code=status)
+    if drain.active:
+        # Останавливаемся: не-2xx — Telegram доставит апдейт повторно (уже новому процессу)
+        return Response(status_code=503, headers={"Retry-After": "1"})
+    try:
+        update = json.loads(await req.body())
+    except ValueError:
+        STATS["webhook_rejected_body"] += 1
+        return Response(status_code=400)
+    await dp.feed_webhook_update(bot, update, received_at=received_at)
     return Response(status_code=200)
 
+# ===================== Polling =====================
+POLL_LIMIT_MIN = 10
+POLL_LIMIT_MAX = 100  # максимум getUpdates
+POLL_TIMEOUT_MAX = 30
+
+def tune_polling(received: int, limit: int, timeout: int) -> tuple[int, int]:
+    """
+    Подстраиваем getUpdates под трафик: полная пачка — значит в очереди есть ещё,
+    берём больше и без ожидания; пустая — уменьшаем пачку и ждём долго.
+    """
+    if received >= limit:
+        return min(limit * 2, POLL_LIMIT_MAX), 0
+    if received == 0:
+        return max(limit // 2, POLL_LIMIT_MIN), POLL_TIMEOUT_MAX
+    return limit, min(timeout + 5, POLL_TIMEOUT_MAX)
+
+async def process_polled_update(update, slots: asyncio.Semaphore, received_at: float):
+    try:
+        await dp.feed_update(bot, update, received_at=received_at)
+    except Exception:
+        log.exception("Update id=%s failed", update.update_id)
+    finally:
+        slots.release()
+
+async def run_polling():
+    """
+    Long polling для запуска без публичного URL.
+    Пачка апдейтов раскидывается по задачам: разные пользователи обрабатываются
+    параллельно, порядок внутри одного пользователя держит events_isolation.
+    """
+    webhook_deleted = False
+    offset = None
+    limit, timeout = POLL_LIMIT_MIN, POLL_TIMEOUT_MAX
+    backoff = 1.0
+    slots = asyncio.Semaphore(POLL_MAX_TASKS)
+    tasks: set[asyncio.Task] = set()
+
+    try:
+        while True:
+            try:
+                if not webhook_deleted:
+                    # Пока вебхук стоит, getUpdates отвечает 409 — снимаем его тут же, с повторами
+                    await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+                    webhook_deleted = True
+                updates = await bot.get_updates(
+                    offset=offset,
+                    limit=limit,
+                    timeout=timeout,
+                    allowed_updates=ALLOWED_UPDATES,
+                    request_timeout=timeout + 10,
+                )
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramNetworkError, TelegramServerError, TelegramConflictError) as e:
+                log.warning("getUpdates failed: %s; retry in %.0fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            except Exception:
+                # 401, 404, ошибка в коде — polling не бросаем: без него бот молчит, а /healthz зелёный
+                log.exception("Polling failed; retry in %.0fs", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            received_at = time.monotonic()
+
+            for update in updates:
+                # Семафор — backpressure: не тянем новые апдейты, пока заняты все слоты
+                await slots.acquire()
+                task = asyncio.create_task(process_polled_update(update, slots, received_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                # Сдвигаем offset только за апдейтом, который уже ушёл в обработку
+                offset = update.update_id + 1
+
+            limit, timeout = tune_polling(len(updates), limit, timeout)
+    finally:
+        if tasks:
+            await asyncio.wait(tasks, timeout=DRAIN_TIMEOUT)
+        if offset is not None:
+            # Подтверждаем обработанные апдейты, иначе после рестарта Telegram пришлёт их снова
+            with suppress(Exception):
+                await bot.get_updates(offset=offset, limit=1, timeout=0)
+
+class Poller:
+    """Фоновая задача run_polling. alive — для /healthz и /readyz: умерший polling не должен выглядеть здоровым."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._task = asyncio.create_task(run_polling())
+        self._task.add_done_callback(self._stopped)
+
+    @staticmethod
+    def _stopped(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Polling stopped", exc_info=task.exception())
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def wait(self):
+        if self._task is not None:
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def stop(self):
+        self.cancel()
+        await self.wait()
+
+poller = Poller()
+
+async def main_polling():
+    await dp.emit_startup(bot=bot)
+    poller.start()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, poller.cancel)
+    try:
+        await poller.wait()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+
+# ===================== HTTP =====================
 @app.get("/")
 async def ok():
     return {"ok": True}
@@ -1196,3 +3148,91 @@ async def ok():
 @app.head("/")
 async def ok_head():
     return Response(status_code=200)
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: loop крутится, сэмплер тикает, без вебхука — жив polling
+    stalled = lag_monitor.stalled_for()
+    polling_ok = bool(WEBHOOK_URL) or poller.alive
+    alive = lag_monitor.running and stalled < LIVE_MAX_STALL and polling_ok
+    body = {
+        "alive": alive,
+        "polling": polling_ok,
+        "loop_lag_ms": round(lag_monitor.lag * 1000, 1),
+        "loop_stalled_ms": round(stalled * 1000, 1),
+        "loop_stalls": lag_monitor.stalls,
+    }
+    return JSONResponse(body, status_code=200 if alive else 503)
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: инстанс успевает обрабатывать апдейты — можно слать трафик
+    try:
+        rtt = await asyncio.wait_for(storage_rtt(), READY_MAX_STORAGE_RTT)
+    except asyncio.TimeoutError:
+        rtt = None
+    calls, errors = api_errors.totals()
+    checks = {
+        "loop_lag": lag_monitor.running and lag_monitor.lag_max < READY_MAX_LAG,
+        "in_flight": admission.inflight < SHED_THRESHOLD,
+        "not_draining": not drain.active,
+        "polling": bool(WEBHOOK_URL) or poller.alive,
+        "storage": rtt is not None,
+        "bot_api": calls < API_ERROR_MIN_CALLS or errors / calls < READY_MAX_API_ERROR_RATE,
+    }
+    ready = all(checks.values())
+    body = {
+        "ready": ready,
+        "checks": checks,
+        "loop_lag_max_ms": round(lag_monitor.lag_max * 1000, 1),
+        "updates_in_flight": admission.inflight,
+        "storage_rtt_ms": None if rtt is None else round(rtt * 1000, 3),
+        "bot_api_calls": calls,
+        "bot_api_errors": errors,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/export")
+def export(
+    req: Request,
+    format: str = "csv",
+    date_from: str | None = Query(None, alias="from"),
+    date_to: str | None = Query(None, alias="to"),
+    lang: str | None = None,
+    lvl: str | None = None,
+):
+    # Синхронный эндпоинт и генератор: FastAPI гоняет их в threadpool, event loop свободен
+    secret = req.headers.get("x-export-secret", "")
+    if not EXPORT_SECRET or not hmac.compare_digest(secret.encode(), EXPORT_SECRET.encode()):
+        return Response(status_code=404)
+    if format not in ("csv", "jsonl"):
+        return Response(status_code=400)
+    try:
+        accept = export_filter(date_from, date_to, lang, lvl)
+    except ValueError:
+        return Response(status_code=400)
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        iter_export(format, accept),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="applications.{format}"'},
+    )
+
+@app.get("/stats")
+async def stats():
+    return {
+        **STATS,
+        "updates_in_flight": admission.inflight,
+        "sessions_live": storage.live,
+        "sessions_bytes": storage.bytes,
+        "admin_queued": admin_outbox.pending,
+        "reminders_pending": reminders.pending,
+        "loop_lag_ms": round(lag_monitor.lag * 1000, 1),
+        "loop_stalls": lag_monitor.stalls,
+    }
+
+if __name__ == "__main__":
+    # python main.py — только polling, без FastAPI/uvicorn
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main_polling())
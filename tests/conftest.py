@@ -0,0 +1,71 @@
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+API_PORT = _free_port()
+
+# main.py читает окружение при импорте — задаём до него. Бот ходит только в фейковый API
+os.environ.update({
+    "BOT_TOKEN": "123:TEST",
+    "ADMIN_CHAT_ID": "-100",
+    "PUBLIC_URL": "",
+    "TELEGRAM_API_URL": f"http://127.0.0.1:{API_PORT}",
+    "DATA_DIR": tempfile.mkdtemp(prefix="recruit-test-"),
+    "ADMIN_ROUTES": "",
+    "ADMIN_RATE_PER_MIN": "60000",
+    "REMINDER_AFTER_MINUTES": "0",
+})
+
+import main  # noqa: E402
+from fakeapi import FakeAPI  # noqa: E402
+
+REAL_THROTTLE_RATES = dict(main.THROTTLE_RATES)
+
+@pytest.fixture(scope="session")
+def loop():
+    # Один loop на все тесты: локи, очереди и HTTP-сессия бота живут между тестами
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(main.admin_outbox.close())
+    loop.run_until_complete(main.bot.session.close())
+    loop.close()
+
+@pytest.fixture(scope="session")
+def fake_api(loop):
+    api = FakeAPI()
+    loop.run_until_complete(api.start(API_PORT))
+    yield api
+    loop.run_until_complete(api.stop())
+
+@pytest.fixture
+def api(fake_api):
+    fake_api.reset()
+    return fake_api
+
+@pytest.fixture
+def run(loop, api):
+    """run(coro) — выполнить корутину в общем loop."""
+    return loop.run_until_complete
+
+@pytest.fixture(autouse=True)
+def no_throttle(monkeypatch):
+    # Тесты гоняют анкеты быстрее человека; флуд-контроль проверяется отдельно
+    monkeypatch.setattr(main, "THROTTLE_RATES", {kind: (10**6, 10**6) for kind in REAL_THROTTLE_RATES})
+
+@pytest.fixture
+def throttled(monkeypatch):
+    """Настоящие лимиты флуд-контроля (autouse no_throttle их снимает)."""
+    monkeypatch.setattr(main, "THROTTLE_RATES", dict(REAL_THROTTLE_RATES))
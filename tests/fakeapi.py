@@ -0,0 +1,112 @@
+"""
+Фейковый Bot API для тестов: aiohttp-сервер на 127.0.0.1, бот ходит в него через TELEGRAM_API_URL.
+Записывает все вызовы, умеет отдавать апдейты getUpdates, задержку, ошибки и придержанные ответы по методу.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp import web
+
+class FakeAPI:
+    def __init__(self):
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.runner: web.AppRunner | None = None
+        self.msg_ids = itertools.count(100)
+        self.reset()
+
+    def reset(self):
+        self.calls: list[tuple[str, dict, float]] = []  # (метод, параметры, monotonic)
+        self.updates: list[dict] = []  # отдаются getUpdates по offset
+        self.latency = 0.0
+        # метод или (метод, chat_id) -> (код, описание, доп. поля)
+        self.fail: dict[str | tuple[str, str], tuple[int, str, dict]] = {}
+        # метод или (метод, chat_id) -> ответ только после set(); вызов записан сразу
+        self.hold: dict[str | tuple[str, str], asyncio.Event] = {}
+        self.webhook = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+
+    async def start(self, port: int):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def sent(self, method: str, chat_id: int | None = None) -> list[dict]:
+        """Параметры вызовов method (в чат chat_id, если задан)."""
+        return [
+            data for name, data, _ in self.calls
+            if name == method and (chat_id is None or str(data.get("chat_id")) == str(chat_id))
+        ]
+
+    def count(self, method: str) -> int:
+        return sum(name == method for name, _, _ in self.calls)
+
+    async def _params(self, req: web.Request) -> dict:
+        try:
+            data = dict(await req.post())
+        except Exception:
+            data = {}
+        if not data:
+            try:
+                data = await req.json()
+            except Exception:
+                data = {}
+        return data
+
+    async def handle(self, req: web.Request):
+        method = req.match_info["method"]
+        data = await self._params(req)
+        self.calls.append((method, data, time.monotonic()))
+
+        name = method.lower()
+        if name == "getupdates":
+            offset = int(data.get("offset") or 0)
+            limit = int(data.get("limit") or 100)
+            result = [u for u in self.updates if u["update_id"] >= offset][:limit]
+            if not result:
+                await asyncio.sleep(min(float(data.get("timeout") or 0), 0.05))
+            return web.json_response({"ok": True, "result": result})
+
+        hold = self.hold.get((method, str(data.get("chat_id")))) or self.hold.get(method)
+        if hold is not None:
+            await hold.wait()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        failure = self.fail.get((method, str(data.get("chat_id")))) or self.fail.get(method)
+        if failure:
+            code, description, extra = failure
+            return web.json_response(
+                {"ok": False, "error_code": code, "description": description, **extra}, status=code
+            )
+
+        if name == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "recruit_bot"}
+        elif name == "getwebhookinfo":
+            result = self.webhook
+        elif name == "setwebhook":
+            self.webhook = {
+                "url": data.get("url"),
+                "has_custom_certificate": False,
+                "pending_update_count": 0,
+                "max_connections": int(data.get("max_connections", 40)),
+                "allowed_updates": json.loads(data["allowed_updates"]) if data.get("allowed_updates") else None,
+            }
+            result = True
+        elif name in ("sendmessage", "editmessagetext", "sendphoto", "senddocument"):
+            result = {
+                "message_id": next(self.msg_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(data.get("chat_id", 1)), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        elif name == "copymessage":
+            result = {"message_id": next(self.msg_ids)}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
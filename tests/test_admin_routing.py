@@ -0,0 +1,143 @@
+import asyncio
+import os
+
+import pytest
+
+import main
+from updates import applications_of, cb, feed, feed_all, form_steps, new_uid
+
+def test_routes_parse_errors():
+    for spec in ("lang=ua -1001", "lang=de -> -1001", "lvl=90-80 -> -1001", "lvl= -> -1001", "clan=x -> -1001"):
+        with pytest.raises(ValueError):
+            main.AdminRoutes.parse(spec, (main.ADMIN_CHAT_ID, None))
+
+def test_application_goes_to_its_chat_and_topic(run, api, monkeypatch):
+    routes = main.AdminRoutes.parse("lang=ua -> -200:7; lvl=80-99 prof=necro -> -300", (main.ADMIN_CHAT_ID, None))
+    monkeypatch.setattr(main, "admin_routes", routes)
+    ua, necro, other = new_uid(), new_uid(), new_uid()
+
+    async def scenario():
+        await feed_all(form_steps(ua, lang="ua", contact="ні"))
+        await feed_all(form_steps(necro, lvl="85", prof="Necro / Sorc"))
+        await feed_all(form_steps(other, lvl="85", prof="Bishop"))
+        assert await main.admin_outbox.flush(10)
+
+    run(scenario())
+
+    def delivered(chat_id: int, uid: int) -> list[dict]:
+        return [m for m in api.sent("sendMessage", chat_id) if f"<code>{uid}</code>" in m["text"]]
+
+    assert [m["message_thread_id"] for m in delivered(-200, ua)] == ["7"]
+    assert len(delivered(-300, necro)) == 1
+    assert len(delivered(main.ADMIN_CHAT_ID, other)) == 1
+    assert not delivered(main.ADMIN_CHAT_ID, ua) and not delivered(main.ADMIN_CHAT_ID, necro)
+
+def test_full_queue_leaves_no_orphan_application(run, api, monkeypatch, tmp_path):
+    # Админ-чат почти стоит: очередь на одну заявку, следующие получают QueueFull
+    outbox = main.AdminOutbox(str(tmp_path / "outbox.jsonl"), 1, 1)
+    monkeypatch.setattr(main, "admin_outbox", outbox)
+    uids = [new_uid() for _ in range(4)]
+    full = main.STATS["admin_queue_full"]
+
+    async def scenario():
+        for uid in uids:
+            await feed_all(form_steps(uid))
+            await asyncio.sleep(0.05)  # воркер забирает первую заявку из очереди
+
+    run(scenario())
+
+    accepted = [a["user_id"] for a in applications_of(uids)]
+    refused = uids[len(accepted):]
+    assert accepted == uids[:len(accepted)] and refused
+    assert main.STATS["admin_queue_full"] == full + len(refused)
+    # Отказанным — анкета обратно на подтверждение, номер не выдан
+    for uid in refused:
+        assert run(main.dp.fsm.get_context(main.bot, uid, uid).get_state()) == main.Form.confirm.state
+
+    # Место освободилось — повторная отправка получает следующий номер, без дыр
+    run(outbox.close())
+    monkeypatch.setattr(main, "admin_outbox", main.AdminOutbox(str(tmp_path / "outbox2.jsonl"), 60_000, 100))
+    run(feed(cb(refused[0], "confirm_send")))
+    run(main.admin_outbox.close())
+    numbers = [a["no"] for a in applications_of(uids)]
+    assert numbers == list(range(numbers[0], numbers[0] + len(accepted) + 1))
+
+def test_outbox_follows_migration_and_survives_errors(run, api, tmp_path):
+    outbox = main.AdminOutbox(str(tmp_path / "outbox.jsonl"), 60_000, 100)
+    failed = main.STATS["admin_failed"]
+
+    def put(app_no: int):
+        outbox.put({"chat_id": -400, "thread_id": None, "text": f"app {app_no}", "user_id": 1,
+                    "app_no": app_no, "photo_id": None, "photo_kind": None})
+
+    def texts(chat_id: int) -> list[str]:
+        return [m["text"] for m in api.sent("sendMessage", chat_id)]
+
+    async def scenario():
+        # Группу обновили до супергруппы: заявка и все следующие — в новый chat_id
+        api.fail[("sendMessage", "-400")] = (
+            400, "Bad Request: group chat was upgraded to a supergroup chat", {"parameters": {"migrate_to_chat_id": -401}},
+        )
+        put(1)
+        assert await outbox.flush(5)
+        put(2)
+        assert await outbox.flush(5)
+        assert texts(-401) == ["app 1", "app 2"] and len(texts(-400)) == 1
+
+        # Ошибка вне сетевых и 400/403 — заявка считается недоставленной, воркер жив
+        api.fail[("sendMessage", "-401")] = (404, "Not Found", {})
+        put(3)
+        assert await outbox.flush(5)
+        del api.fail[("sendMessage", "-401")]
+        put(4)
+        assert await outbox.flush(5)
+
+        # Упавший воркер поднимается при следующей заявке
+        outbox._workers[-401].cancel()
+        await asyncio.sleep(0)
+        put(5)
+        assert await outbox.flush(5)
+        assert await outbox.close() == 0
+
+    run(scenario())
+    assert texts(-401) == ["app 1", "app 2", "app 3", "app 4", "app 5"]
+    assert main.STATS["admin_failed"] == failed + 1
+
+def test_outbox_replays_undelivered_after_crash(run, api, tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    outbox = main.AdminOutbox(path, 60_000, 100)
+
+    def put(box, app_no: int):
+        box.put({"chat_id": -500, "thread_id": None, "text": f"app {app_no}", "user_id": 1,
+                 "app_no": app_no, "photo_id": None, "photo_kind": None})
+
+    def texts() -> list[str]:
+        return [m["text"] for m in api.sent("sendMessage", -500)]
+
+    async def scenario():
+        put(outbox, 1)
+        assert await outbox.flush(5)
+        # Всё доставлено — журнал пуст
+        assert not os.path.exists(path)
+
+        held = api.hold[("sendMessage", "-500")] = asyncio.Event()
+        for app_no in (2, 3, 4):
+            put(outbox, app_no)
+        while len(texts()) < 2:
+            await asyncio.sleep(0.01)
+        # kill -9: ни close, ни сохранения — только то, что уже в журнале
+        for task in outbox._workers.values():
+            task.cancel()
+        await asyncio.sleep(0)
+        del api.hold[("sendMessage", "-500")]
+        held.set()
+
+        restarted = main.AdminOutbox(path, 60_000, 100)
+        assert restarted.load() == 3
+        assert await restarted.flush(5)
+        assert await restarted.close() == 0
+        assert not os.path.exists(path)
+
+    run(scenario())
+    # Оборванная на падении отправка уходит ещё раз, остальные — по разу
+    assert texts() == ["app 1", "app 2", "app 2", "app 3", "app 4"]
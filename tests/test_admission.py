@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import main
+from updates import cb, feed, msg, new_uid
+
+async def poll_until(api, updates: list[dict], done, timeout: float = 20.0):
+    """Апдейты одной пачкой getUpdates через настоящий run_polling — лимиты по умолчанию."""
+    api.updates.extend(updates)
+    poller = main.Poller()
+    poller.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while not done():
+            assert time.monotonic() < deadline, "updates not answered"
+            await asyncio.sleep(0.02)
+    finally:
+        await poller.stop()
+
+def distinct_stripes(count: int) -> list[int]:
+    """Пользователи в разных полосах локов: никто не ждёт чужой лок перед слотом хэндлера."""
+    used, uids = set(), []
+    while len(uids) < count:
+        uid = new_uid()
+        stripe = hash((uid, uid)) % main.LOCK_STRIPES
+        if stripe not in used:
+            used.add(stripe)
+            uids.append(uid)
+    return uids
+
+def test_default_limits_fit_the_concurrency_cap():
+    # Без PUBLIC_URL — polling, потолок POLL_MAX_TASKS апдейтов в работе
+    assert main.UPDATE_CONCURRENCY == main.POLL_MAX_TASKS
+    assert main.HANDLER_SLOTS < main.SHED_THRESHOLD < main.UPDATE_CONCURRENCY
+
+def test_overload_is_shed_with_default_limits(run, api):
+    # Хэндлеры медленные: все апдейты оказываются в работе одновременно
+    api.latency = 1.0
+    uids = [new_uid() for _ in range(main.POLL_MAX_TASKS)]
+    shed = main.STATS["updates_shed"]
+
+    run(poll_until(api, [msg(uid, "/start") for uid in uids],
+                   lambda: all(api.sent("sendMessage", uid) for uid in uids)))
+
+    busy = [uid for uid in uids if api.sent("sendMessage", uid)[0]["text"] == main.TXT["ru"]["busy"]]
+    assert len(busy) == main.UPDATE_CONCURRENCY - main.SHED_THRESHOLD
+    assert main.STATS["updates_shed"] == shed + len(busy)
+    # Отказываем последним в пачке, а не первым
+    assert busy == uids[-len(busy):]
+
+def test_callbacks_overtake_queued_messages(run, api, monkeypatch):
+    messages = main.HANDLER_SLOTS + 20
+    uids = distinct_stripes(messages + 20)
+    writers, clickers = uids[:messages], uids[messages:]
+    for uid in clickers:
+        run(feed(msg(uid, "/start")))
+
+    granted = []
+    acquire = main.priority_gate.gate.acquire
+
+    async def recording_acquire(priority: int):
+        await acquire(priority)
+        granted.append(priority)
+
+    monkeypatch.setattr(main.priority_gate.gate, "acquire", recording_acquire)
+    api.latency = 0.2
+    updates = [msg(uid, "hello") for uid in writers] + [cb(uid, "choose_lang") for uid in clickers]
+
+    run(poll_until(api, updates, lambda: len(granted) == len(updates) and main.admission.inflight == 0))
+
+    # Первые HANDLER_SLOTS слотов заняли текстовые апдейты; из очереди колбэки прошли раньше
+    # остальных текстовых, хотя пришли позже них
+    assert 0 not in granted[messages:]
+    assert granted.count(0) == len(clickers)
@@ -0,0 +1,53 @@
+import asyncio
+
+import main
+
+def test_unexpected_error_is_counted_not_fatal(run, api, monkeypatch, tmp_path):
+    log = main.ApplicationLog(str(tmp_path / "applications.jsonl"))
+    monkeypatch.setattr(main, "applications", log)
+    users = [501, 502, 503]
+    for no, uid in enumerate(users, 1):
+        log.append({"no": no, "ts": "2026-01-01T00:00:00+00:00", "user_id": uid})
+    broadcast = main.Broadcast(str(tmp_path / "broadcast.json"), main.PacedSender(1000))
+
+    async def scenario():
+        # 404 — не из ожидаемых ошибок отправки
+        api.fail[("sendMessage", "502")] = (404, "Not Found", {})
+        broadcast.start({
+            "id": 1, "text": "news", "from_message_id": None, "total": len(users),
+            "done": 0, "sent": 0, "blocked": 0, "failed": 0,
+            "status": "running", "status_message_id": 7,
+        })
+        await asyncio.wait_for(broadcast._task, 5)
+
+    run(scenario())
+    st = broadcast.state
+    assert (st["status"], st["done"], st["sent"], st["failed"]) == ("done", 3, 2, 1)
+    assert [m["chat_id"] for m in api.sent("sendMessage") if m["text"] == "news"] == ["501", "502", "503"]
+
+def test_broadcast_waits_while_handlers_are_busy(run, api, monkeypatch, tmp_path):
+    log = main.ApplicationLog(str(tmp_path / "applications.jsonl"))
+    monkeypatch.setattr(main, "applications", log)
+    users = [601, 602]
+    for no, uid in enumerate(users, 1):
+        log.append({"no": no, "ts": "2026-01-01T00:00:00+00:00", "user_id": uid})
+    broadcast = main.Broadcast(str(tmp_path / "broadcast.json"), main.PacedSender(1000))
+    # Живые анкеты заняли половину слотов хэндлеров — лимит Telegram нужен им
+    monkeypatch.setattr(main.admission, "inflight", main.BACKGROUND_BUSY_INFLIGHT)
+
+    def delivered() -> list[dict]:
+        return [m for m in api.sent("sendMessage") if m["text"] == "later"]
+
+    async def scenario():
+        broadcast.start({
+            "id": 2, "text": "later", "from_message_id": None, "total": len(users),
+            "done": 0, "sent": 0, "blocked": 0, "failed": 0,
+            "status": "running", "status_message_id": 7,
+        })
+        await asyncio.sleep(0.5)
+        assert not delivered() and broadcast.running
+        main.admission.inflight = 0
+        await asyncio.wait_for(broadcast._task, 5)
+
+    run(scenario())
+    assert len(delivered()) == 2 and broadcast.state["status"] == "done"
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+import main
+from updates import cb, feed, feed_all, form_steps, msg, new_uid
+
+def test_ledger_prunes_expired_entries():
+    ledger = main.CooldownLedger(timedelta(hours=12))
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    ledger.record(1, t0)
+    ledger.record(2, t0 + timedelta(hours=1))
+    ledger.record(1, t0 + timedelta(hours=2))  # повторная заявка — в конец
+
+    assert ledger.remaining(1, t0 + timedelta(hours=3)) == timedelta(hours=11)
+    # Через 12 часов после заявки 2 — её запись срезана, запись 1 ещё в окне
+    assert ledger.remaining(2, t0 + timedelta(hours=13)) is None
+    assert len(ledger) == 1 and [u for u, _ in ledger.items()] == [1]
+    assert ledger.remaining(1, t0 + timedelta(hours=14)) is None
+    assert len(ledger) == 0
+
+def alerts(api, update: dict) -> list[dict]:
+    query_id = update["callback_query"]["id"]
+    return [a for a in api.sent("answerCallbackQuery") if a.get("callback_query_id") == query_id]
+
+def state_of(run, uid: int) -> str | None:
+    return run(main.dp.fsm.get_context(main.bot, uid, uid).get_state())
+
+def test_cooldown_blocks_at_form_start(run, api):
+    uid = new_uid()
+    run(feed_all(form_steps(uid)))
+    left = main.last_submit.remaining(uid, datetime.now(timezone.utc))
+    assert left is not None
+
+    run(feed_all([msg(uid, "/start"), cb(uid, "lang:ru")]))
+    for data in ("start_form", "restart"):
+        update = cb(uid, data)
+        run(feed(update))
+        (answer,) = alerts(api, update)
+        assert answer["show_alert"] == "true"
+        assert answer["text"].startswith(main.TXT["ru"]["cooldown"].split("{", 1)[0])
+        # Анкета не началась: шаг 1 не показан
+        assert state_of(run, uid) == main.Form.lang.state
+
+def test_banned_user_blocked_at_form_start(run, api, monkeypatch):
+    uid = new_uid()
+    monkeypatch.setattr(main, "BANNED_USER_IDS", frozenset({uid}))
+    run(feed_all([msg(uid, "/start"), cb(uid, "lang:ru")]))
+    update = cb(uid, "start_form")
+    run(feed(update))
+    (answer,) = alerts(api, update)
+    assert answer["text"] == main.TXT["ru"]["banned"]
+    assert state_of(run, uid) == main.Form.lang.state
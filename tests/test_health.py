@@ -0,0 +1,21 @@
+import asyncio
+import time
+
+import main
+
+def test_watchdog_reports_block_between_sampler_ticks(run):
+    monitor = main.LoopLagMonitor(main.LAG_SAMPLE_INTERVAL, main.LAG_WINDOW, 0.2)
+
+    async def scenario():
+        monitor.start()
+        for block in (0.3, 0.45, 0.6):
+            # Сразу после тика сэмплера: до следующего ещё почти весь интервал
+            await asyncio.sleep(main.LAG_SAMPLE_INTERVAL + 0.01)
+            stalls = monitor.stalls
+            time.sleep(block)
+            await asyncio.sleep(0.1)
+            assert monitor.stalls == stalls + 1, block
+        assert monitor.running
+        await monitor.close()
+
+    run(scenario())
@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import i18n
+import main
+from updates import applications_of, feed_all, form_steps, new_uid
+
+def copy_locales(tmp_path) -> str:
+    out = tmp_path / "locales"
+    out.mkdir()
+    for name in os.listdir(i18n.LOCALES_DIR):
+        if name.endswith(".json"):
+            shutil.copy(os.path.join(i18n.LOCALES_DIR, name), out / name)
+    return str(out)
+
+def test_build_rejects_missing_keys_and_placeholders(tmp_path):
+    locales = copy_locales(tmp_path)
+    path = os.path.join(locales, "en.json")
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    del catalog["welcome"]
+    catalog["cooldown"] = "Try again in {hours} h"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False)
+
+    with pytest.raises(i18n.CatalogError) as e:
+        i18n.compile_catalogs(locales, code_paths=(main.__file__,))
+    assert "en: missing keys welcome" in str(e.value)
+    assert "en.cooldown: placeholders differ" in str(e.value)
+
+@pytest.fixture
+def with_german(tmp_path, monkeypatch):
+    """Новый язык — только файл каталога: locales/de.json, без правок main.py."""
+    locales = copy_locales(tmp_path)
+    with open(os.path.join(locales, "en.json"), encoding="utf-8") as f:
+        catalog = json.load(f)
+    catalog.update({
+        "lang_button": "🇩🇪 Deutsch",
+        "lang_name": "Deutsch",
+        "contact_none": "nein",
+        "contact_none_words": "nein, kein, no",
+    })
+    with open(os.path.join(locales, "de.json"), "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False)
+
+    catalogs = i18n.load_catalogs(locales, code_paths=(main.__file__,))
+    monkeypatch.setattr(main, "TXT", catalogs)
+    monkeypatch.setattr(main, "SUPPORTED_LANGS", catalogs.langs)
+    main.no_contact_words.cache_clear()
+    yield catalogs
+    main.no_contact_words.cache_clear()
+
+def test_added_language_goes_through_the_form(run, api, with_german):
+    assert "de" in main.SUPPORTED_LANGS
+    assert main.lang_from_code("de-AT") == "de"
+
+    uid = new_uid()
+    run(feed_all(form_steps(uid, lang="de", contact="Nein")))
+    (app,) = applications_of([uid])
+    assert app["lang"] == "de"
+    # Админам "контакта нет" — всегда по-русски, независимо от языка анкеты
+    assert app["contact"] == "нет"
+
+    buttons = [b.text for row in main.k_lang().inline_keyboard for b in row]
+    assert "🇩🇪 Deutsch" in buttons
+
+def test_no_contact_words_work_in_every_form_language(run, api):
+    for lang, answer in (("ru", "ні"), ("ru", "нема"), ("en", "нет"), ("en", "ні"), ("ua", "none")):
+        uid = new_uid()
+        run(feed_all(form_steps(uid, lang=lang, contact=answer)))
+        (app,) = applications_of([uid])
+        assert app["contact"] == "нет", (lang, answer)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from contextlib import suppress
+
+import httpx
+import pytest
+
+import main
+from updates import applications_of, form_steps, new_uid
+
+USERS = 50
+
+@pytest.fixture(autouse=True)
+def no_shedding(monkeypatch):
+    # Пачки по 100 апдейтов от 50 пользователей — admission control отвечал бы "занято"; здесь проверяем доставку
+    monkeypatch.setattr(main, "SHED_THRESHOLD", 10**6)
+
+def interleaved(flows: list[list[dict]]) -> list[dict]:
+    """Апдейты разных пользователей вперемешку, как их отдаёт Telegram; порядок внутри пользователя сохранён."""
+    out = []
+    for step in range(max(len(f) for f in flows)):
+        out.extend(f[step] for f in flows if step < len(f))
+    # update_id у Telegram растёт в порядке выдачи — на нём держится offset
+    first = min(u["update_id"] for u in out)
+    for i, update in enumerate(out):
+        update["update_id"] = first + i
+    return out
+
+async def wait_applications(uids: list[int], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while len(applications_of(uids)) < len(uids):
+        assert time.monotonic() < deadline, "not all applications arrived"
+        await asyncio.sleep(0.02)
+
+async def polling_run(api, uids: list[int]):
+    updates = interleaved([form_steps(uid) for uid in uids])
+    api.updates.extend(updates)
+    poller = asyncio.create_task(main.run_polling())
+    try:
+        await wait_applications(uids)
+    finally:
+        poller.cancel()
+        with suppress(asyncio.CancelledError):
+            await poller
+    # При остановке последний offset подтверждён — после рестарта апдейты не придут повторно
+    last = api.sent("getUpdates")[-1]
+    assert int(last["offset"]) == updates[-1]["update_id"] + 1
+
+async def webhook_run(uids: list[int]):
+    headers = {"x-telegram-bot-api-secret-token": main.WEBHOOK_SECRET}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        async def user(uid):
+            # Как Telegram: апдейты одного чата по очереди, разных — параллельно
+            for update in form_steps(uid):
+                r = await client.post(main.WEBHOOK_PATH, json=update, headers=headers)
+                assert r.status_code == 200
+
+        await asyncio.gather(*(user(uid) for uid in uids))
+
+def test_polling_processes_every_user_in_order(run, api):
+    api.latency = 0.005
+    uids = [new_uid() for _ in range(USERS)]
+    run(polling_run(api, uids))
+
+    apps = applications_of(uids)
+    assert sorted(a["user_id"] for a in apps) == sorted(uids)
+    for a in apps:
+        assert a["nick"] == f"Nick{a['user_id']}"
+        assert a["why"] == f"because {a['user_id']}"
+
+def test_polling_and_webhook_take_the_same_load(run, api):
+    api.latency = 0.005
+    polled = [new_uid() for _ in range(USERS)]
+    hooked = [new_uid() for _ in range(USERS)]
+    run(polling_run(api, polled))
+    run(webhook_run(hooked))
+    assert len(applications_of(polled)) == len(applications_of(hooked)) == USERS
+
+def test_polling_survives_errors_at_boot(run, api):
+    uid = new_uid()
+    api.updates.extend(form_steps(uid))
+    poller = main.Poller()
+
+    async def scenario():
+        # Сначала 401 (не сетевая ошибка), затем 502 — polling ждёт и пробует снова
+        api.fail["deleteWebhook"] = (401, "Unauthorized", {})
+        poller.start()
+        await asyncio.sleep(0.5)
+        assert poller.alive and api.count("getUpdates") == 0
+        api.fail["deleteWebhook"] = (502, "Bad Gateway", {})
+        await asyncio.sleep(1.0)
+        del api.fail["deleteWebhook"]
+        try:
+            await wait_applications([uid])
+        finally:
+            await poller.stop()
+
+    run(scenario())
+    assert api.count("deleteWebhook") == 3
+    assert not poller.alive
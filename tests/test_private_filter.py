@@ -0,0 +1,48 @@
+import pytest
+
+import main
+from updates import cb, feed, msg, new_uid
+
+GROUP = -555
+
+@pytest.fixture
+def state_reads(monkeypatch):
+    reads = []
+    get_state = main.storage.get_state
+
+    async def counting_get_state(key):
+        reads.append(key)
+        return await get_state(key)
+
+    monkeypatch.setattr(main.storage, "get_state", counting_get_state)
+    return reads
+
+def test_group_updates_dropped_before_fsm(run, api, state_reads):
+    filtered = main.STATS["group_updates_filtered"]
+    users = [new_uid() for _ in range(3)]
+    updates = [
+        msg(users[0], "hello", chat_type="supergroup", chat_id=GROUP),
+        msg(users[1], "/start", chat_type="supergroup", chat_id=GROUP),
+        msg(users[2], "/start", chat_type="supergroup", chat_id=GROUP),
+        msg(users[0], "Nick", chat_type="supergroup", chat_id=GROUP),
+        cb(users[1], "start_form", chat_type="supergroup", chat_id=GROUP),
+    ]
+    for update in updates:
+        run(feed(update))
+
+    assert state_reads == []
+    assert main.STATS["group_updates_filtered"] == filtered + len(updates)
+    # На два /start — одно "только в личке"
+    notices = api.sent("sendMessage", GROUP)
+    assert len(notices) == 1
+    assert notices[0]["text"] == main.TXT["ru"]["private_only"]
+    assert api.count("answerCallbackQuery") == 0
+
+def test_private_and_admin_chat_still_handled(run, api, state_reads):
+    uid = new_uid()
+    run(feed(msg(uid, "/start")))
+    assert api.sent("sendMessage", uid)[0]["text"] == main.TXT["ru"]["welcome"]
+    assert state_reads
+
+    run(feed(msg(uid, "/broadcast_status", chat_type="supergroup", chat_id=main.ADMIN_CHAT_ID)))
+    assert api.sent("sendMessage", main.ADMIN_CHAT_ID)
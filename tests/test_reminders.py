@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+import main
+from updates import cb, feed_all, msg, new_uid
+
+def test_unexpected_error_does_not_stop_reminders(run, api):
+    broken, ok = new_uid(), new_uid()
+    scheduler = main.ReminderScheduler(60, main.PacedSender(1000))
+    failed = main.STATS["reminders_failed"]
+
+    async def scenario():
+        for uid in (broken, ok):
+            await feed_all([msg(uid, "/start"), cb(uid, "lang:ru"), cb(uid, "start_form")])
+        # 404 — не из ожидаемых ошибок отправки
+        api.fail[("sendMessage", str(broken))] = (404, "Not Found", {})
+        scheduler.start()
+        now = time.monotonic()
+        for i, uid in enumerate((broken, ok)):
+            scheduler._push(StorageKey(bot_id=main.bot.id, chat_id=uid, user_id=uid), now + i * 0.01)
+        text = main.TXT["ru"]["reminder"].format(step=main.STATE_TO_STEP[main.Form.nick.state], total=main.TOTAL_STEPS)
+        deadline = time.monotonic() + 5
+        while text not in [m["text"] for m in api.sent("sendMessage", ok)]:
+            assert time.monotonic() < deadline, "second reminder not sent"
+            await asyncio.sleep(0.01)
+        assert scheduler._task is not None and not scheduler._task.done()
+        await scheduler.close()
+
+    run(scenario())
+    assert main.STATS["reminders_failed"] == failed + 1
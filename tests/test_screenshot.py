@@ -0,0 +1,48 @@
+import main
+from updates import applications_of, feed_all, form_steps, msg, new_uid, photo_sizes
+
+def document(file_id: str, mime_type: str, file_size: int) -> dict:
+    return {"document": {
+        "file_id": file_id, "file_unique_id": f"u{file_id}", "file_name": "shot", "mime_type": mime_type,
+        "file_size": file_size,
+    }}
+
+def hints(api, uid: int) -> list[str]:
+    keys = {main.TXT["ru"]["step6_photo_bad"]: "bad", main.TXT["ru"]["step6_photo_big"]: "big"}
+    return [keys[m["text"]] for m in api.sent("sendMessage", uid) if m["text"] in keys]
+
+def test_screenshot_forwarded_by_file_id(run, api):
+    photo_user, doc_user = new_uid(), new_uid()
+    photo_steps = [
+        msg(photo_user, None, **document("DOC_PDF", "application/pdf", 50_000)),
+        msg(photo_user, "вот скрин"),
+        msg(photo_user, None, photo=photo_sizes("PH_BIG", 11 * 1024 * 1024)),
+        msg(photo_user, None, photo=photo_sizes("PH1", 200_000)),
+    ]
+    doc_steps = [msg(doc_user, None, **document("DOC_PNG", "image/png", 300_000))]
+
+    async def scenario():
+        await feed_all(form_steps(photo_user, photo=photo_steps))
+        await feed_all(form_steps(doc_user, photo=doc_steps))
+        assert await main.admin_outbox.flush(10)
+
+    run(scenario())
+
+    # Неподходящее отклонено с подсказкой, анкета ждёт скриншот дальше
+    assert hints(api, photo_user) == ["bad", "bad", "big"]
+    assert hints(api, doc_user) == []
+    apps = {a["user_id"]: a for a in applications_of([photo_user, doc_user])}
+    assert apps[photo_user]["photo_file_id"] == "PH1"
+    assert apps[doc_user]["photo_file_id"] == "DOC_PNG"
+
+    # Админам — тем же file_id и тем же типом, ответом на текст заявки
+    photos = [p for p in api.sent("sendPhoto", main.ADMIN_CHAT_ID) if p["photo"] in ("PH1", "PH_BIG")]
+    docs = [d for d in api.sent("sendDocument", main.ADMIN_CHAT_ID) if d["document"] in ("DOC_PNG", "DOC_PDF")]
+    assert [p["photo"] for p in photos] == ["PH1"]
+    assert [d["document"] for d in docs] == ["DOC_PNG"]
+    for sent, uid in ((photos[0], photo_user), (docs[0], doc_user)):
+        assert sent["caption"] == f"📸 Скриншот к заявке №{apps[uid]['no']}"
+        assert sent["reply_to_message_id"]
+
+    # Файл не скачивался: ни getFile, ни запросов за байтами
+    assert api.count("getFile") == 0
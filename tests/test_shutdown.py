@@ -0,0 +1,88 @@
+import asyncio
+import os
+import re
+from collections import Counter
+
+import httpx
+
+import main
+from updates import applications_of, form_steps, new_uid
+
+USERS = 100
+
+def new_process(monkeypatch):
+    """Всё, что живёт только в памяти процесса, — как после рестарта."""
+    for key in [key for key, *_ in main.storage.records()]:
+        main.storage._drop(key)
+    main.last_submit._last.clear()
+    main._rendered.clear()
+    monkeypatch.setattr(main, "dup_index", main.DuplicateIndex(main.dup_index.path))
+    monkeypatch.setattr(main, "drain", main.Drain())
+
+def test_restart_under_load_loses_no_application(run, api, monkeypatch):
+    monkeypatch.setattr(main, "DRAIN_TIMEOUT", 1.0)
+    monkeypatch.setattr(main, "SHED_THRESHOLD", 10**6)
+    monkeypatch.setattr(main, "drain", main.Drain())
+    api.latency = 0.005
+    uids = [new_uid() for _ in range(USERS)]
+    # К остановке первая половина отправила заявку, вторая — на середине анкеты
+    done, midway = uids[:USERS // 2], uids[USERS // 2:]
+    flows = {uid: form_steps(uid) for uid in uids}
+    cut = len(flows[uids[0]]) // 2
+    saved = {}
+
+    async def scenario():
+        # Очередь общая на все тесты — сначала досылаем чужое
+        assert await main.admin_outbox.flush(10)
+        await main.admin_outbox.close()
+        await main.dp.emit_startup(bot=main.bot)
+        # Админ-чат не отвечает до рестарта: все заявки первой половины остаются в очереди
+        admin_send = api.hold[("sendMessage", str(main.ADMIN_CHAT_ID))] = asyncio.Event()
+
+        headers = {"x-telegram-bot-api-secret-token": main.WEBHOOK_SECRET}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            async def user(updates):
+                for update in updates:
+                    r = await client.post(main.WEBHOOK_PATH, json=update, headers=headers)
+                    assert r.status_code == 200
+
+            await asyncio.gather(
+                *(user(flows[uid]) for uid in done),
+                *(user(flows[uid][:cut]) for uid in midway),
+            )
+            while not api.sent("sendMessage", main.ADMIN_CHAT_ID):
+                await asyncio.sleep(0.01)
+
+            # SIGTERM: lifespan делает drain.begin() и останавливает диспетчер
+            main.drain.begin()
+            await main.dp.emit_shutdown(bot=main.bot)
+            saved["snapshot"] = os.path.exists(main.SNAPSHOT_PATH)
+            saved["outbox"] = os.path.exists(main.ADMIN_OUTBOX_PATH)
+            saved["submitted"] = len(applications_of(uids))
+
+            new_process(monkeypatch)
+            del api.hold[("sendMessage", str(main.ADMIN_CHAT_ID))]
+            admin_send.set()
+            await main.dp.emit_startup(bot=main.bot)
+            await asyncio.gather(*(user(flows[uid][cut:]) for uid in midway))
+
+        assert await main.admin_outbox.flush(10)
+        await main.dp.emit_shutdown(bot=main.bot)
+
+    run(scenario())
+
+    assert saved["snapshot"] and saved["outbox"]
+    assert saved["submitted"] == len(done)
+
+    apps = Counter(a["user_id"] for a in applications_of(uids))
+    assert apps == Counter(uids)
+    delivered = Counter(
+        int(re.search(r"ID: <code>(\d+)</code>", m["text"]).group(1))
+        for m in api.sent("sendMessage", main.ADMIN_CHAT_ID)
+        if "Новая заявка" in m["text"]
+    )
+    ours = Counter({uid: delivered[uid] for uid in uids})
+    assert all(ours[uid] >= 1 for uid in uids)
+    # Повтор — только заявка, чья отправка оборвалась на остановке
+    assert ours.total() - USERS == 1
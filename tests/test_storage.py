@@ -0,0 +1,100 @@
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+import main
+
+def key(n: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=n, user_id=n)
+
+class RecordingBuckets(dict):
+    """_expiry, который помнит, какие корзины чистильщик снимал."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.popped = []
+
+    def pop(self, slot, *default):
+        self.popped.append(slot)
+        return super().pop(slot, *default)
+
+def test_sweep_expires_only_due_buckets():
+    storage = main.BoundedMemoryStorage(ttl=600, max_sessions=100, bucket=60)
+    dropped = []
+    storage.on_state = lambda k, state: state is None and dropped.append(k)
+    now = time.monotonic()
+    storage.restore(key(1), main.Form.nick.state, main.Application("ru"), ttl_left=30)
+    storage.restore(key(2), main.Form.nick.state, main.Application("ru"), ttl_left=300)
+    storage._expiry = RecordingBuckets(storage._expiry)
+    later_slot = int(storage.peek(key(2)).expires // storage.bucket)
+
+    assert storage.sweep(now + 90) == 1
+    current = int((now + 90) // storage.bucket)
+    assert storage._expiry.popped and all(slot < current for slot in storage._expiry.popped)
+    assert later_slot not in storage._expiry.popped
+    assert dropped == [key(1)]
+    assert storage.peek(key(1)) is None and storage.peek(key(2)) is not None
+
+    # Второй проход по тем же корзинам не ходит
+    storage._expiry.popped.clear()
+    assert storage.sweep(now + 90) == 0
+    assert not storage._expiry.popped
+
+    assert storage.sweep(now + 400) == 1
+    assert dropped == [key(1), key(2)]
+    assert storage.live == 0 and storage.bytes == 0
+
+def test_lru_eviction_at_max_sessions(run):
+    storage = main.BoundedMemoryStorage(ttl=600, max_sessions=3)
+    dropped = []
+    storage.on_state = lambda k, state: state is None and dropped.append(k)
+    evicted = main.STATS["sessions_evicted"]
+
+    async def scenario():
+        for n in (1, 2, 3):
+            await storage.set_state(key(n), main.Form.nick)
+            storage.get_form(key(n)).nick = f"Nick{n}"
+        # Обращение поднимает сессию в LRU — вытесняется следующая по давности
+        assert await storage.get_state(key(1)) == main.Form.nick.state
+        await storage.set_state(key(4), main.Form.nick)
+
+    run(scenario())
+    assert storage.live == 3
+    assert storage.peek(key(2)) is None
+    assert [k.user_id for k, *_ in storage.records()] == [3, 1, 4]
+    assert dropped == [key(2)]
+    assert main.STATS["sessions_evicted"] == evicted + 1
+
+def test_live_and_bytes_return_to_zero(run):
+    storage = main.BoundedMemoryStorage(ttl=600, max_sessions=100)
+
+    async def scenario():
+        await storage.set_state(key(1), main.Form.nick)
+        form = storage.get_form(key(1))
+        form.nick, form.why = "Nick", "because " * 50
+        await storage.set_state(key(1), main.Form.real_name)
+        assert storage.live == 1 and storage.bytes > 0
+        # Анкету сбросили и из состояния вышли — сессии больше нет
+        storage.set_form(key(1), None)
+        await storage.set_state(key(1), None)
+
+    run(scenario())
+    assert storage.live == 0 and storage.bytes == 0
+
+def test_application_pack_round_trip():
+    form = main.Application("ua")
+    form.nick, form.why = "Ник", "бо 🏰"
+    form.lvl, form.noble, form.discipline = 85, 0, False
+    form.photo_id, form.photo_kind = "AgACAgI", main.PHOTO_KINDS.index("document")
+
+    back = main.Application.unpack(form.pack())
+    assert back.as_dict() == form.as_dict()
+    # Коды: 0 и False — заполнено, None — нет
+    assert back.noble == 0 and back.discipline is False
+    assert back.mic is None and back.ready is None and back.real_name is None
+
+    empty = main.Application.unpack(main.Application().pack())
+    assert empty.as_dict() == {}
+
+    form.discipline = True
+    assert main.Application.unpack(form.pack()).discipline is True
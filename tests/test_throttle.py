@@ -0,0 +1,61 @@
+import asyncio
+
+import main
+from updates import cb, feed, msg, new_uid
+
+OTHERS = 20
+FLOOD = 500
+
+async def gather(coros) -> list:
+    return await asyncio.gather(*coros)
+
+def test_flood_from_one_user_is_dropped_before_fsm(run, api, throttled, monkeypatch):
+    flooder = new_uid()
+    run(feed(msg(flooder, "/start")))
+    run(feed(cb(flooder, "start_form")))
+
+    reads = 0
+    get_state = main.storage.get_state
+
+    async def counting_get_state(key):
+        nonlocal reads
+        if key.user_id == flooder:
+            reads += 1
+        return await get_state(key)
+
+    monkeypatch.setattr(main.storage, "get_state", counting_get_state)
+    replies_before = len(api.sent("sendMessage", flooder))
+    dropped_before = main.STATS["updates_throttled"] + main.STATS["updates_muted_dropped"]
+    muted_before = main.STATS["users_muted"]
+
+    run(gather(feed(msg(flooder, f"spam {i}")) for i in range(FLOOD)))
+
+    capacity = main.THROTTLE_RATES["message"][0]
+    dropped = main.STATS["updates_throttled"] + main.STATS["updates_muted_dropped"] - dropped_before
+    assert dropped >= FLOOD - capacity
+    assert main.STATS["users_muted"] == muted_before + 1
+    # Прошло не больше ёмкости бакета — столько и чтений состояния, и ответов
+    assert reads <= capacity
+    assert len(api.sent("sendMessage", flooder)) - replies_before <= capacity
+
+def test_flood_does_not_crowd_out_other_users(run, api, throttled):
+    flooder = new_uid()
+    others = [new_uid() for _ in range(OTHERS)]
+    updates = [msg(flooder, f"spam {i}") for i in range(FLOOD)]
+    # Обычные пользователи — посреди флуда
+    step = FLOOD // OTHERS
+    for i, uid in enumerate(others):
+        updates.insert(i * (step + 1), msg(uid, "/start"))
+    replies_before = len(api.sent("sendMessage", flooder))
+    shed_before = main.STATS["updates_shed"]
+
+    run(gather(feed(u) for u in updates))
+
+    # Без флуд-контроля апдейты флудера ждут его лока, но уже занимают места в admission —
+    # после SHED_THRESHOLD из них остальные получают "занято" вместо ответа.
+    # С ним флуд отбрасывается до admission: каждый получил обычное приветствие
+    for uid in others:
+        assert [m["text"] for m in api.sent("sendMessage", uid)] == [main.TXT["ru"]["welcome"]], uid
+    assert main.STATS["updates_shed"] == shed_before
+    capacity = main.THROTTLE_RATES["message"][0]
+    assert len(api.sent("sendMessage", flooder)) - replies_before <= capacity
@@ -0,0 +1,49 @@
+import json
+
+import httpx
+
+import main
+from updates import msg, new_uid
+
+def test_webhook_gate_rejects_before_dispatch(run, monkeypatch):
+    fed = []
+
+    async def recording_feed(bot, update, **kwargs):
+        fed.append(update)
+
+    monkeypatch.setattr(main.dp, "feed_webhook_update", recording_feed)
+    update = msg(new_uid(), "/start")
+    body = json.dumps(update).encode()
+    good = {"x-telegram-bot-api-secret-token": main.WEBHOOK_SECRET, "content-type": "application/json"}
+
+    async def chunked():
+        yield body
+
+    cases = [
+        ("secret", 403, {"content-type": "application/json"}, body),
+        ("secret", 403, {**good, "x-telegram-bot-api-secret-token": "wrong"}, body),
+        ("type", 415, {**good, "content-type": "text/plain"}, body),
+        ("type", 415, {**good, "content-type": "application/x-www-form-urlencoded"}, body),
+        # Без Content-Length (chunked) и больше лимита — тело не читаем
+        ("size", 413, good, chunked()),
+        ("size", 413, good, b" " * (main.WEBHOOK_MAX_BODY + 1)),
+        ("body", 400, good, b"{not json"),
+    ]
+    before = {kind: main.STATS[f"webhook_rejected_{kind}"] for kind in ("secret", "type", "size", "body")}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            for kind, status, headers, content in cases:
+                r = await client.post(main.WEBHOOK_PATH, content=content, headers=headers)
+                assert r.status_code == status, (kind, headers)
+            assert not fed
+            # Всё в порядке — апдейт доходит до диспетчера
+            r = await client.post(main.WEBHOOK_PATH, content=body, headers=good)
+            assert r.status_code == 200
+
+    run(scenario())
+    assert fed == [update]
+    for kind in before:
+        expected = sum(case[0] == kind for case in cases)
+        assert main.STATS[f"webhook_rejected_{kind}"] == before[kind] + expected, kind
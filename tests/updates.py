@@ -0,0 +1,90 @@
+"""Сборка апдейтов Telegram (dict, как в вебхуке) и прогон их через диспетчер."""
+
+import itertools
+import time
+
+from aiogram.types import Update
+
+import main
+
+_ids = itertools.count(1)
+_users = itertools.count(1_000)
+
+def new_uid() -> int:
+    """Свой пользователь на каждый тест: кулдауны и сессии между тестами не пересекаются."""
+    return next(_users)
+
+def _user(uid: int, language_code: str) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": "U", "username": f"user{uid}", "language_code": language_code}
+
+def msg(uid: int, text: str | None, chat_type: str = "private", chat_id: int | None = None,
+        language_code: str = "ru", **extra) -> dict:
+    message = {
+        "message_id": next(_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id or uid, "type": chat_type},
+        "from": _user(uid, language_code),
+        **extra,
+    }
+    if text is not None:
+        message["text"] = text
+    return {"update_id": next(_ids), "message": message}
+
+def cb(uid: int, data: str, chat_type: str = "private", chat_id: int | None = None, message_id: int = 10) -> dict:
+    return {"update_id": next(_ids), "callback_query": {
+        "id": str(next(_ids)),
+        "chat_instance": "x",
+        "data": data,
+        "from": _user(uid, "ru"),
+        "message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id or uid, "type": chat_type},
+            "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+            "text": "x",
+        },
+    }}
+
+def photo_sizes(file_id: str, file_size: int) -> list[dict]:
+    return [
+        {"file_id": f"{file_id}_s", "file_unique_id": f"u{file_id}_s", "width": 90, "height": 90, "file_size": 1000},
+        {"file_id": file_id, "file_unique_id": f"u{file_id}", "width": 1280, "height": 720, "file_size": file_size},
+    ]
+
+def form_steps(uid: int, lang: str = "ru", lvl: str = "78", prof: str = "Necro",
+               photo: list[dict] | None = None, contact: str = "нет") -> list[dict]:
+    """
+    Вся анкета от /start до отправки. Ответы уникальны для пользователя — по ним
+    проверяем, что в заявку попали его апдейты и ни один не потерялся.
+    photo — апдейты шага скриншота вместо кнопки "пропустить".
+    """
+    return [
+        msg(uid, "/start"),
+        cb(uid, f"lang:{lang}"),
+        cb(uid, "start_form"),
+        msg(uid, f"Nick{uid}"),
+        msg(uid, f"Name{uid}"),
+        msg(uid, contact),
+        msg(uid, f"City{uid}"),
+        msg(uid, prof),
+        msg(uid, lvl),
+        *(photo if photo is not None else [cb(uid, "photo:skip")]),
+        cb(uid, "noble:yes"),
+        msg(uid, f"evenings {uid}"),
+        cb(uid, "mic:yes"),
+        cb(uid, "ready:yes"),
+        msg(uid, f"because {uid}"),
+        cb(uid, "disc:yes"),
+        cb(uid, "confirm_send"),
+    ]
+
+async def feed(update: dict):
+    await main.dp.feed_update(main.bot, Update.model_validate(update, context={"bot": main.bot}))
+
+async def feed_all(updates: list[dict]):
+    for update in updates:
+        await feed(update)
+
+def applications_of(uids) -> list[dict]:
+    uids = set(uids)
+    return [r for r in main.applications.iter() if r["user_id"] in uids]